@@ -0,0 +1,118 @@
+"""
+Comptes utilisateurs liés à Google : création à la première connexion et mise à jour
+"""
+import re
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+User = get_user_model()
+
+# Nombre de tentatives si un autre inscrit prend le même username entre-temps
+USERNAME_MAX_ATTEMPTS = 5
+
+# Nombre maximal de chiffres ajoutés au username dérivé de l'email
+USERNAME_MAX_SUFFIX_DIGITS = 6
+
+
+def next_free_username(base):
+    """
+    Premier username libre de la forme base, base1, base2... en une seule requête
+    sur le préfixe (servie par l'index unique de username), au lieu d'un exists()
+    par collision. Seuls les suffixes canoniques (1, 2... sans zéro initial) sont
+    comptés ; la base est tronquée pour que base + suffixe tienne dans max_length.
+    Au-delà de USERNAME_MAX_SUFFIX_DIGITS chiffres, le suffixe est tiré au hasard.
+    """
+    max_length = User._meta.get_field('username').max_length
+    base = base[:max_length - USERNAME_MAX_SUFFIX_DIGITS]
+    pattern = re.compile(re.escape(base) + r'([1-9]\d*)?')
+
+    suffixes = set()
+    for username in User.objects.filter(username__startswith=base).values_list('username', flat=True):
+        match = pattern.fullmatch(username)
+        if match:
+            suffixes.add(int(match.group(1) or 0))
+
+    if 0 not in suffixes:
+        return base
+    suffix = str(max(suffixes) + 1)
+    if len(suffix) > USERNAME_MAX_SUFFIX_DIGITS:
+        # Éviter un suffixe démesuré (ex. un username existant base99999999...)
+        lowest = 10 ** (USERNAME_MAX_SUFFIX_DIGITS - 1)
+        suffix = str(lowest + secrets.randbelow(9 * lowest))
+    return f'{base}{suffix}'
+
+
+def create_google_user(google_id, email, first_name, last_name, picture):
+    """Créer l'utilisateur avec un username dérivé de l'email, unique même sous inscriptions concurrentes"""
+    base_username = email.split('@')[0]
+    for attempt in range(USERNAME_MAX_ATTEMPTS):
+        username = next_free_username(base_username)
+        try:
+            with transaction.atomic():
+                return User.objects.create_user(
+                    username=username,
+                    email=email,
+                    first_name=first_name,
+                    last_name=last_name,
+                    google_id=google_id,
+                    avatar_url=picture,  # Sauvegarder l'image de profil Google
+                    is_active=True
+                )
+        except IntegrityError:
+            # Réessayer seulement si c'est le username qui a été pris entre-temps,
+            # pas l'email ou le google_id (même compte créé par une connexion concurrente)
+            if (
+                attempt == USERNAME_MAX_ATTEMPTS - 1
+                or not User.objects.filter(username=username).exists()
+                or User.objects.filter(Q(google_id=google_id) | Q(email=email)).exists()
+            ):
+                raise
+
+
+def upsert_google_user(google_id, email, first_name, last_name, picture):
+    """
+    Retrouver l'utilisateur par google_id ou email (une seule requête, le compte lié
+    à google_id est prioritaire), sinon le créer. Seuls les champs modifiés sont écrits,
+    et aucune écriture n'a lieu si rien n'a changé.
+    Deux premières connexions simultanées : la création perdante échoue sur l'unicité
+    de l'email ou du google_id, dans son savepoint, et relit le compte créé par l'autre.
+    """
+    for attempt in range(2):
+        candidates = list(User.objects.filter(Q(google_id=google_id) | Q(email=email))[:2])
+        user = next((candidate for candidate in candidates if candidate.google_id == google_id), None)
+        if user is None and candidates:
+            user = candidates[0]
+
+        if user is None:
+            try:
+                with transaction.atomic():
+                    return create_google_user(google_id, email, first_name, last_name, picture)
+            except IntegrityError:
+                if attempt:
+                    raise
+                continue
+
+        changed_fields = []
+        if user.google_id == google_id:
+            # Mettre à jour l'avatar si l'utilisateur existe déjà
+            if picture and user.avatar_url != picture:
+                user.avatar_url = picture
+                changed_fields.append('avatar_url')
+        elif not user.google_id:
+            # L'utilisateur existe (inscrit par email) mais n'a pas de google_id : l'ajouter
+            user.google_id = google_id
+            changed_fields.append('google_id')
+            if picture and user.avatar_url != picture:
+                user.avatar_url = picture
+                changed_fields.append('avatar_url')
+
+        if changed_fields:
+            user.save(update_fields=changed_fields + ['updated_at'])
+        return user
+
+
+aupsert_google_user = sync_to_async(upsert_google_user)
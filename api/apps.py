@@ -1,7 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .pruning import start_token_pruner
+        start_token_pruner()
+
+        if getattr(settings, 'GOOGLE_CLIENTS_EAGER_INIT', False):
+            from .google_clients import registry
+            registry.warm_up()
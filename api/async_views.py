@@ -0,0 +1,155 @@
+"""
+Vues asynchrones natives (servies par l'application ASGI)
+
+Les endpoints qui attendent Google (OAuth, Speech-to-Text) n'occupent pas de
+thread pendant l'attente : appels HTTP via httpx, ORM asynchrone, et appels
+aux SDK Google (bloquants) déportés dans des threads.
+DRF 3.14 ne gérant pas les vues async, ce sont des vues Django qui reprennent
+les mêmes messages d'erreur et codes de statut que les vues de views.py.
+Les décorateurs csrf_exempt/require_POST de Django 4.2 ne gérant pas non plus
+les coroutines, l'exemption CSRF et la méthode sont traitées ici directement.
+"""
+import json
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connections
+from django.http import HttpResponseNotAllowed, JsonResponse
+
+from .accounts import aupsert_google_user
+from .audio import uploaded_audio_buffer
+from .google_auth import averify_google_id_token, afetch_google_userinfo, GoogleTokenError
+from .serializers import UserSerializer
+from .speech import transcribe, SpeechConfigurationError
+from .tokens import issue_tokens_for_user
+
+User = get_user_model()
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _request_data(request):
+    """Corps JSON ou formulaire, comme les parsers DRF"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _transcribe_in_worker_thread(audio_content, content_type):
+    """
+    transcribe dans un thread de l'exécuteur (thread_sensitive=False) : Django ne gère pas
+    les connexions de ces threads, celles ouvertes par le cache de traduction sont fermées ici
+    """
+    close_old_connections()
+    try:
+        return transcribe(audio_content, content_type)
+    finally:
+        connections.close_all()
+
+
+async def google_oauth_async(request):
+    """Authentification via Google OAuth (version asynchrone de views.google_oauth)"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    data = _request_data(request)
+    if data is None:
+        return json_response({'error': 'Corps de requête JSON invalide.'}, status=400)
+
+    access_token = data.get('access_token')
+    credential = data.get('credential')
+    if not access_token and not credential:
+        return json_response({'error': 'Token Google ou credential requis.'}, status=400)
+
+    try:
+        if credential:
+            try:
+                token_data = await averify_google_id_token(credential)
+            except GoogleTokenError:
+                return json_response({'error': 'Credential Google invalide.'}, status=401)
+            google_id = token_data.get('sub')
+        else:
+            try:
+                token_data = await afetch_google_userinfo(access_token)
+            except GoogleTokenError:
+                return json_response({'error': 'Token Google invalide.'}, status=401)
+            google_id = token_data.get('id')
+
+        email = token_data.get('email')
+        if not google_id or not email:
+            return json_response({'error': 'Informations Google incomplètes.'}, status=400)
+
+        user = await aupsert_google_user(
+            google_id,
+            email,
+            token_data.get('given_name', ''),
+            token_data.get('family_name', ''),
+            token_data.get('picture', ''),
+        )
+        tokens = await sync_to_async(issue_tokens_for_user)(user)
+
+        return json_response({
+            'user': UserSerializer(user, context={'request': request}).data,
+            'tokens': tokens,
+        })
+    except httpx.HTTPError as e:
+        return json_response({'error': f'Erreur lors de la vérification du token Google: {str(e)}'}, status=500)
+    except Exception as e:
+        return json_response({'error': f'Erreur lors de l\'authentification Google: {str(e)}'}, status=500)
+
+
+async def transcribe_audio_async(request):
+    """Transcription audio (version asynchrone de views.transcribe_audio)"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        if 'audio' not in request.FILES:
+            return json_response({'error': 'Aucun fichier audio fourni.'}, status=400)
+
+        audio_file = request.FILES['audio']
+
+        # Vérifier la taille du fichier (limite de 10MB)
+        if audio_file.size > 10 * 1024 * 1024:
+            return json_response({'error': 'Le fichier audio est trop volumineux (max 10MB).'}, status=400)
+
+        try:
+            from google.cloud import speech  # noqa: F401
+        except ImportError:
+            return json_response({
+                'error': 'Google Cloud Speech-to-Text n\'est pas installé. Installez-le avec: pip install google-cloud-speech'
+            }, status=500)
+
+        content_type = audio_file.content_type or 'audio/webm'
+
+        # Le SDK Google est bloquant : reconnaissance + traduction dans un thread,
+        # sur le fichier lu sans copie (mmap ou tampon mémoire)
+        try:
+            with uploaded_audio_buffer(audio_file) as audio_content:
+                response_data = await sync_to_async(_transcribe_in_worker_thread, thread_sensitive=False)(
+                    audio_content, content_type
+                )
+        except SpeechConfigurationError as e:
+            return json_response({'error': str(e)}, status=500)
+
+        return json_response(response_data)
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        return json_response({
+            'error': f'Erreur lors de la transcription: {str(e)}',
+            'details': error_trace if settings.DEBUG else None
+        }, status=500)
+
+
+google_oauth_async.csrf_exempt = True
+transcribe_audio_async.csrf_exempt = True
@@ -0,0 +1,291 @@
+"""
+Normalisation de l'audio avant Speech-to-Text
+
+Les paramètres réels (fréquence d'échantillonnage, nombre de canaux) sont lus
+dans l'en-tête WAV, FLAC ou MP3 au lieu d'être supposés. Le PCM (WAV) est
+décodé avec NumPy, mixé en mono et rééchantillonné à TARGET_SAMPLE_RATE, puis
+envoyé en LINEAR16 brut : l'encodage le plus compact que l'on sache produire
+sans codec natif. Les formats compressés (Opus, MP3, FLAC) sont transmis tels
+quels avec leurs vrais paramètres.
+"""
+import io
+import logging
+import mmap
+import struct
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'TARGET_SAMPLE_RATE': 16000,  # suffisant pour la parole
+    'FILTER_TAPS': 63,  # longueur du filtre passe-bas avant sous-échantillonnage
+}
+
+# LINEAR16 sans en-tête (mono, little-endian), produit par normalize_audio
+RAW_PCM_CONTENT_TYPE = 'audio/l16'
+
+WAV_CONTENT_TYPES = ('audio/wav', 'audio/x-wav', 'audio/wave')
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),  # MPEG-2.5
+}
+
+
+class AudioFormatError(Exception):
+    """En-tête audio illisible"""
+
+
+class PreparedAudio:
+    """Audio prêt pour la reconnaissance, avec les paramètres à déclarer à Google"""
+
+    def __init__(self, content, content_type, sample_rate_hertz=None, channels=None):
+        self.content = content
+        self.content_type = content_type
+        self.sample_rate_hertz = sample_rate_hertz
+        self.channels = channels
+
+    def __repr__(self):
+        return (f'PreparedAudio({self.content_type}, {len(self.content)} octets, '
+                f'{self.sample_rate_hertz} Hz, {self.channels} canaux)')
+
+
+def get_normalization_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'AUDIO_NORMALIZATION', {}))
+    return options
+
+
+def base_content_type(content_type):
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+# --- Lecture du fichier envoyé ---
+
+@contextmanager
+def mapped_file(path):
+    """Projection mémoire (lecture seule) d'un fichier audio sur le disque"""
+    with open(path, 'rb') as f:
+        if not f.seek(0, 2):
+            yield b''
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield buffer
+    finally:
+        try:
+            buffer.close()
+        except BufferError:
+            # Une vue (tableau NumPy...) existe encore : la projection sera libérée avec elle
+            pass
+
+
+@contextmanager
+def uploaded_audio_buffer(uploaded_file):
+    """
+    Contenu d'un fichier envoyé sous forme de tampon, sans le recopier en bytes :
+    mmap du fichier temporaire (fichiers > FILE_UPLOAD_MAX_MEMORY_SIZE) ou vue
+    sur le tampon en mémoire. Le tampon n'est valable que dans le bloc `with`.
+    """
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        with mapped_file(uploaded_file.temporary_file_path()) as buffer:
+            yield buffer
+    elif isinstance(uploaded_file.file, io.BytesIO):
+        # Tant que la vue existe, le BytesIO ne peut être ni redimensionné ni fermé : la libérer en sortie
+        view = uploaded_file.file.getbuffer()
+        try:
+            yield view
+        finally:
+            try:
+                view.release()
+            except BufferError:
+                # Une vue dérivée (tableau NumPy...) existe encore : libérée avec elle
+                pass
+    else:
+        uploaded_file.seek(0)
+        yield uploaded_file.read()
+
+
+# --- Lecture des en-têtes ---
+
+def parse_wav_header(data):
+    """
+    Paramètres d'un WAV (RIFF) et position du chunk data, sans copier les échantillons.
+    Retourne un dict : format_tag, channels, sample_rate, bits_per_sample, data_offset, data_size.
+    """
+    if len(data) < 12 or data[0:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise AudioFormatError('En-tête WAV invalide.')
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = bytes(data[offset:offset + 4])
+        chunk_size = struct.unpack_from('<I', data, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            format_tag, channels, sample_rate, _, _, bits_per_sample = struct.unpack_from('<HHIIHH', data, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # Les deux premiers octets du GUID SubFormat portent le vrai format
+                format_tag = struct.unpack_from('<H', data, body + 24)[0]
+            fmt = {
+                'format_tag': format_tag,
+                'channels': channels,
+                'sample_rate': sample_rate,
+                'bits_per_sample': bits_per_sample,
+            }
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise AudioFormatError('Chunk fmt manquant avant les données WAV.')
+            # Taille parfois absente (0 ou 0xFFFFFFFF) pour les flux enregistrés en direct
+            data_size = min(chunk_size, len(data) - body) if chunk_size else len(data) - body
+            fmt['data_offset'] = body
+            fmt['data_size'] = data_size
+            return fmt
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise AudioFormatError('Chunk data introuvable dans le WAV.')
+
+
+def parse_flac_header(data):
+    """Fréquence et nombre de canaux depuis le bloc STREAMINFO d'un FLAC"""
+    if len(data) < 22 or data[0:4] != b'fLaC' or data[4] & 0x7F != 0:
+        raise AudioFormatError('En-tête FLAC invalide.')
+    sample_rate = (data[18] << 12) | (data[19] << 4) | (data[20] >> 4)
+    channels = ((data[20] >> 1) & 0x07) + 1
+    return {'sample_rate': sample_rate, 'channels': channels}
+
+
+def parse_mp3_header(data):
+    """Fréquence et nombre de canaux depuis le premier en-tête de trame MP3 (après un éventuel tag ID3v2)"""
+    offset = 0
+    if data[0:3] == b'ID3' and len(data) >= 10:
+        tag_size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + tag_size
+
+    limit = min(len(data) - 4, offset + 64 * 1024)
+    while offset < limit:
+        if data[offset] == 0xFF and data[offset + 1] & 0xE0 == 0xE0:
+            version = (data[offset + 1] >> 3) & 0x03
+            layer = (data[offset + 1] >> 1) & 0x03
+            rate_index = (data[offset + 2] >> 2) & 0x03
+            if version != 1 and layer != 0 and rate_index != 3:
+                channel_mode = (data[offset + 3] >> 6) & 0x03
+                return {
+                    'sample_rate': MP3_SAMPLE_RATES[version][rate_index],
+                    'channels': 1 if channel_mode == 3 else 2,
+                }
+        offset += 1
+
+    raise AudioFormatError('Aucune trame MP3 trouvée.')
+
+
+# --- Traitement du signal (vectorisé) ---
+
+def decode_pcm(data, fmt):
+    """Échantillons WAV -> tableau float32 (frames, canaux) dans [-1, 1]"""
+    raw = memoryview(data)[fmt['data_offset']:fmt['data_offset'] + fmt['data_size']]
+    bits = fmt['bits_per_sample']
+    channels = max(fmt['channels'], 1)
+    frame_bytes = bits // 8 * channels
+    raw = raw[:len(raw) - len(raw) % frame_bytes]
+
+    if fmt['format_tag'] == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        samples = np.frombuffer(raw, dtype='<f4' if bits == 32 else '<f8').astype(np.float32)
+    elif fmt['format_tag'] == WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif fmt['format_tag'] == WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif fmt['format_tag'] == WAVE_FORMAT_PCM and bits == 24:
+        triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        samples = values.astype(np.float32) / 8388608.0
+    elif fmt['format_tag'] == WAVE_FORMAT_PCM and bits == 32:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise AudioFormatError(f'Format WAV non pris en charge (format {fmt["format_tag"]}, {bits} bits).')
+
+    return samples.reshape(-1, channels)
+
+
+def downmix(samples):
+    """Moyenne des canaux -> signal mono"""
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def lowpass_kernel(cutoff_ratio, taps):
+    """Filtre RIF passe-bas (sinc fenêtré de Hamming), cutoff_ratio relatif à la fréquence d'échantillonnage"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff_ratio * n) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(signal, source_rate, target_rate, taps=63):
+    """Rééchantillonnage : passe-bas anti-repliement puis interpolation linéaire"""
+    if source_rate == target_rate or len(signal) == 0:
+        return signal
+    if target_rate < source_rate:
+        signal = np.convolve(signal, lowpass_kernel(0.45 * target_rate / source_rate, taps), mode='same')
+    duration = len(signal) / source_rate
+    positions = np.arange(int(duration * target_rate)) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(signal)), signal).astype(np.float32)
+
+
+def to_linear16(signal):
+    return (np.clip(signal, -1.0, 1.0) * 32767.0).astype('<i2').tobytes()
+
+
+# --- Point d'entrée ---
+
+def normalize_wav(audio_content, options):
+    fmt = parse_wav_header(audio_content)
+    target_rate = options['TARGET_SAMPLE_RATE']
+
+    # Déjà mono 16 bits à une fréquence suffisante : envoyer le WAV tel quel
+    if (fmt['format_tag'] == WAVE_FORMAT_PCM and fmt['bits_per_sample'] == 16
+            and fmt['channels'] == 1 and fmt['sample_rate'] <= target_rate):
+        return PreparedAudio(audio_content, 'audio/wav', fmt['sample_rate'], 1)
+
+    signal = downmix(decode_pcm(audio_content, fmt))
+    # Ne jamais suréchantillonner : un audio à 8 kHz reste à 8 kHz
+    output_rate = min(fmt['sample_rate'], target_rate)
+    signal = resample(signal, fmt['sample_rate'], output_rate, options['FILTER_TAPS'])
+    return PreparedAudio(to_linear16(signal), RAW_PCM_CONTENT_TYPE, output_rate, 1)
+
+
+def prepare_audio(audio_content, content_type):
+    """
+    Audio et paramètres à envoyer à Speech-to-Text. En cas d'en-tête illisible,
+    l'audio est transmis tel quel et Google détecte lui-même ce qu'il peut.
+    """
+    options = get_normalization_settings()
+    kind = base_content_type(content_type)
+
+    try:
+        if kind in WAV_CONTENT_TYPES:
+            if options['ENABLED']:
+                return normalize_wav(audio_content, options)
+            fmt = parse_wav_header(audio_content)
+            return PreparedAudio(audio_content, content_type, fmt['sample_rate'], fmt['channels'])
+        if kind == 'audio/flac':
+            header = parse_flac_header(audio_content)
+            return PreparedAudio(audio_content, content_type, header['sample_rate'], header['channels'])
+        if kind in ('audio/mp3', 'audio/mpeg'):
+            header = parse_mp3_header(audio_content)
+            return PreparedAudio(audio_content, content_type, header['sample_rate'], header['channels'])
+    except (AudioFormatError, struct.error, ValueError) as e:
+        logger.warning(f'Normalisation audio ignorée ({content_type}): {str(e)}')
+
+    # Opus (WebM/Ogg) : Google lit les paramètres dans le conteneur
+    return PreparedAudio(audio_content, content_type)
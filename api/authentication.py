@@ -1,18 +1,53 @@
 """
 Authentification personnalisée pour vérifier la blacklist des access tokens
+
+Avec JWT_LAZY_USER, l'utilisateur n'est pas chargé à chaque requête : il est
+construit depuis les claims signés du token (id, username, is_active, is_staff,
+updated_at) et la ligne api_user n'est lue que si la vue accède à un autre champ.
+L'époque de révocation et la date de dernière modification viennent du cache de
+révocation ; des claims antérieurs à la dernière modification du compte (profil,
+mot de passe, désactivation) ne sont plus utilisés et l'utilisateur est chargé en base.
 """
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
-import jwt
+import logging
+
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .models import OutstandingTokenDigest, User
+from .revocation import get_revocation_cache, issued_before_epoch
+from .tokens import USER_CLAIMS_KEY, timestamp_us
+
+logger = logging.getLogger(__name__)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    Utilisateur paresseux : les champs présents dans les claims sont servis sans
+    requête, tout autre accès charge l'utilisateur complet (une seule fois)
+    """
+
+    def __init__(self, claims, load_user):
+        self.__dict__['_claims'] = claims
+        super().__init__(load_user)
+
+    def __getattr__(self, name):
+        if self._wrapped is empty and name in self.__dict__['_claims']:
+            return self.__dict__['_claims'][name]
+        return super().__getattr__(name)
+
+    def __bool__(self):
+        return True
 
 
 class JWTAuthenticationWithBlacklist(JWTAuthentication):
     """
     Authentification JWT qui vérifie aussi la blacklist pour les access tokens
     """
-    
+
     def authenticate(self, request):
         header = self.get_header(request)
         if header is None:
@@ -23,38 +58,131 @@ class JWTAuthenticationWithBlacklist(JWTAuthentication):
             return None
 
         validated_token = self.get_validated_token(raw_token)
-        
+
         # Vérifier si le token est blacklisté
         try:
-            # Décoder le token pour obtenir le jti
-            raw_token_str = str(validated_token)
-            decoded_token = jwt.decode(
-                raw_token_str,
-                settings.SECRET_KEY,
-                algorithms=['HS256'],
-                options={"verify_signature": False}  # On vérifie juste pour obtenir le jti
-            )
-            jti = decoded_token.get('jti')
-            
+            # Le payload est déjà décodé et vérifié par get_validated_token
+            jti = validated_token.get(api_settings.JTI_CLAIM)
+
             if jti:
-                # Vérifier si ce token est dans la blacklist
-                outstanding_token = OutstandingToken.objects.filter(jti=jti).first()
-                if outstanding_token:
-                    if BlacklistedToken.objects.filter(token=outstanding_token).exists():
-                        raise InvalidToken('Token has been blacklisted.')
+                # Le cache de révocation ne touche la base que pour les jti potentiellement révoqués
+                if get_revocation_cache().is_revoked(jti, validated_token.get('exp')):
+                    raise InvalidToken('Token has been blacklisted.')
             else:
-                # Si pas de jti, vérifier par le token string directement
-                outstanding_token = OutstandingToken.objects.filter(token=raw_token_str).first()
-                if outstanding_token:
-                    if BlacklistedToken.objects.filter(token=outstanding_token).exists():
-                        raise InvalidToken('Token has been blacklisted.')
+                # Si pas de jti, vérifier par l'empreinte indexée du token brut
+                digest = OutstandingTokenDigest.compute(raw_token)
+                if BlacklistedToken.objects.filter(token__digest__digest=digest).exists():
+                    raise InvalidToken('Token has been blacklisted.')
         except InvalidToken:
             # Re-raise les erreurs de blacklist
             raise
-        except (jwt.InvalidTokenError, TokenError, Exception):
-            # Si on ne peut pas décoder ou vérifier, on laisse passer
-            # (l'authentification de base gérera l'erreur)
-            pass
-        
-        return self.get_user(validated_token), validated_token
+        except Exception as e:
+            # Révocation invérifiable (base indisponible...) : refuser plutôt que laisser passer
+            logger.error(f'Vérification de la révocation impossible: {str(e)}')
+            raise InvalidToken('Unable to verify token revocation.')
+
+        if getattr(settings, 'JWT_LAZY_USER', False):
+            return self.get_claims_user(validated_token), validated_token
+
+        user = self.get_user(validated_token)
+
+        # Révocation globale : tokens émis avant le dernier logout de l'utilisateur
+        if issued_before_epoch(validated_token, getattr(user, 'tokens_valid_after', None)):
+            raise InvalidToken('Token has been revoked.')
+
+        return user, validated_token
+
+    def get_claims_user(self, validated_token):
+        """Utilisateur construit depuis les claims du token, sans requête si l'état est en cache"""
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            raise InvalidToken('Token contained no recognizable user identification')
+        # Le claim est sérialisé en chaîne : même type que la clé primaire du modèle
+        user_id = User._meta.pk.to_python(user_id)
+
+        state = get_revocation_cache().get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if issued_before_epoch(validated_token, state['tokens_valid_after']):
+            raise InvalidToken('Token has been revoked.')
+
+        claims = validated_token.get(USER_CLAIMS_KEY)
+        if not claims or claims.get('updated_at') != timestamp_us(state['updated_at']):
+            # Token antérieur aux claims ou compte modifié depuis l'émission : claims périmés
+            user = self.get_user(validated_token)
+            if issued_before_epoch(validated_token, user.tokens_valid_after):
+                raise InvalidToken('Token has been revoked.')
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not claims['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        return ClaimsUser(
+            {
+                'id': user_id,
+                'pk': user_id,
+                'username': claims['username'],
+                'is_active': claims['is_active'],
+                'is_staff': claims['is_staff'],
+                'updated_at': state['updated_at'],
+                'is_authenticated': True,
+                'is_anonymous': False,
+            },
+            lambda: self.get_user(validated_token),
+        )
+
+
+def introspect_tokens(raw_tokens):
+    """
+    Valide un lot de tokens bruts avec les mêmes contrôles que l'authentification :
+    signature et expiration, blacklist, époque de révocation et utilisateur actif.
+    La blacklist et les utilisateurs sont résolus pour tout le lot en requêtes ensemblistes.
+    Retourne, dans l'ordre, {'active': True, 'claims': {...}} ou {'active': False, 'error': ...}.
+    """
+    authentication = JWTAuthenticationWithBlacklist()
+    results = [None] * len(raw_tokens)
+    validated = {}
+    for index, raw_token in enumerate(raw_tokens):
+        if not isinstance(raw_token, str) or not raw_token:
+            results[index] = {'active': False, 'error': 'Token manquant.'}
+            continue
+        try:
+            validated[index] = authentication.get_validated_token(raw_token.encode('utf-8'))
+        except (InvalidToken, TokenError):
+            results[index] = {'active': False, 'error': 'Token invalide ou expiré.'}
+
+    # Blacklist : par jti via le cache de révocation, sinon par l'empreinte du token brut
+    expirations = {}
+    digests = {}
+    for index, token in validated.items():
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti:
+            expirations[jti] = token.get('exp')
+        else:
+            digests[index] = OutstandingTokenDigest.compute(raw_tokens[index])
+    revoked_jtis = get_revocation_cache().revoked_jtis(expirations) if expirations else set()
+    revoked_digests = set()
+    if digests:
+        revoked_digests = set(
+            BlacklistedToken.objects.filter(
+                token__digest__digest__in=list(digests.values())
+            ).values_list('token__digest__digest', flat=True)
+        )
+
+    user_ids = {token.get(api_settings.USER_ID_CLAIM) for token in validated.values()}
+    users = {
+        str(row['pk']): row
+        for row in User.objects.filter(pk__in=user_ids).values('pk', 'is_active', 'tokens_valid_after')
+    }
 
+    for index, token in validated.items():
+        user = users.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        if token.get(api_settings.JTI_CLAIM) in revoked_jtis or digests.get(index) in revoked_digests:
+            results[index] = {'active': False, 'error': 'Token révoqué.'}
+        elif user is None or (api_settings.CHECK_USER_IS_ACTIVE and not user['is_active']):
+            results[index] = {'active': False, 'error': 'Utilisateur introuvable ou inactif.'}
+        elif issued_before_epoch(token, user['tokens_valid_after']):
+            results[index] = {'active': False, 'error': 'Token révoqué.'}
+        else:
+            results[index] = {'active': True, 'claims': token.payload}
+    return results
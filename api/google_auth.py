@@ -0,0 +1,296 @@
+"""
+Vérification des identités Google sans appel réseau à chaque connexion
+
+- Les id_tokens (credential) sont vérifiés localement avec les certificats de
+  signature de Google, mis en cache en mémoire et, si GOOGLE_CERTS_CACHE_FILE est
+  configuré, sur disque (Cache-Control respecté, rafraîchissement en arrière-plan
+  avant expiration). Le claim 'aud' doit être GOOGLE_OAUTH_CLIENT_ID (obligatoire).
+- Seules les adresses email vérifiées par Google sont acceptées : les comptes
+  sont retrouvés ou liés par email.
+- Pour l'ancienne méthode (access_token), la réponse de l'endpoint userinfo est
+  mise en cache quelques secondes, indexée par l'empreinte du token.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from google.auth import exceptions as google_exceptions
+from google.auth import jwt as google_jwt
+
+from .cache import TTLLRUCache
+from .http_client import get_http_client, get_async_http_client
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_USERINFO_URL = 'https://www.googleapis.com/oauth2/v2/userinfo'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+
+class GoogleTokenError(Exception):
+    """Token Google invalide, expiré ou refusé par Google"""
+
+
+class StaticKeySource:
+    """Jeu de certificats fixe (kid -> certificat PEM), utile pour les tests"""
+
+    def __init__(self, certs=None, **kwargs):
+        self.certs = dict(certs or {})
+
+    def get_certs(self, force_refresh=False):
+        return self.certs
+
+
+class GoogleCertsKeySource:
+    """
+    Certificats publics de Google, mis en cache en mémoire et sur disque.
+
+    La durée de vie vient du header Cache-Control (max-age) de la réponse.
+    Quand l'expiration approche, le rafraîchissement se fait dans un thread
+    pour ne pas bloquer la connexion en cours. Les rechargements forcés (kid
+    inconnu) sont limités à un par min_forced_refresh_interval secondes.
+    Le fichier de cache contient des clés de confiance : il est écrit en 0600 et
+    ignoré s'il n'appartient pas au processus ou s'il est modifiable par d'autres.
+    """
+
+    default_max_age = 3600
+    refresh_margin = 300
+    min_forced_refresh_interval = 60
+
+    def __init__(self, url=GOOGLE_CERTS_URL, cache_file=None):
+        self.url = url
+        self.cache_file = cache_file
+        self._certs = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._forced_refresh_lock = threading.Lock()
+        self._last_forced_refresh = None
+        self._load_from_disk()
+
+    def _load_from_disk(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            stat = os.stat(self.cache_file)
+            if stat.st_mode & 0o022 or (hasattr(os, 'getuid') and stat.st_uid != os.getuid()):
+                logger.warning(f'Cache des certificats Google ignoré (propriétaire ou permissions non sûrs): {self.cache_file}')
+                return
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('expires_at', 0) > time.time():
+                self._certs = data['certs']
+                self._expires_at = data['expires_at']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f'Cache des certificats Google illisible: {str(e)}')
+
+    def _save_to_disk(self):
+        if not self.cache_file:
+            return
+        try:
+            directory = os.path.dirname(self.cache_file) or '.'
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # Fichier temporaire au nom imprévisible, créé en 0600
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.google_certs.')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'certs': self._certs, 'expires_at': self._expires_at}, f)
+                os.replace(tmp_path, self.cache_file)
+            except OSError:
+                os.remove(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f'Écriture du cache des certificats Google impossible: {str(e)}')
+
+    def _max_age(self, response):
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        max_age = int(match.group(1)) if match else self.default_max_age
+        try:
+            max_age -= int(response.headers.get('Age', 0))
+        except ValueError:
+            pass
+        return max(max_age, 0)
+
+    def _fetch(self):
+        response = get_http_client().get(self.url)
+        response.raise_for_status()
+        certs = response.json()
+        with self._lock:
+            self._certs = certs
+            self._expires_at = time.time() + self._max_age(response)
+            self._save_to_disk()
+        return certs
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._fetch()
+            except Exception as e:
+                logger.warning(f'Rafraîchissement des certificats Google échoué: {str(e)}')
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name='google-certs-refresh', daemon=True).start()
+
+    def _forced_refresh(self):
+        """Rechargement demandé pour un kid inconnu, au plus une fois par intervalle"""
+        with self._forced_refresh_lock:
+            if (
+                self._certs is not None
+                and self._last_forced_refresh is not None
+                and time.monotonic() - self._last_forced_refresh < self.min_forced_refresh_interval
+            ):
+                return self._certs
+            self._last_forced_refresh = time.monotonic()
+            return self._fetch()
+
+    def get_certs(self, force_refresh=False):
+        now = time.time()
+        if force_refresh:
+            return self._forced_refresh()
+        if self._certs is None or now >= self._expires_at:
+            return self._fetch()
+        if now >= self._expires_at - self.refresh_margin:
+            self._refresh_in_background()
+        return self._certs
+
+
+_key_source = None
+_key_source_lock = threading.Lock()
+
+
+def get_key_source():
+    """Source des certificats configurée par GOOGLE_ID_TOKEN_KEY_SOURCE (créée à la première utilisation)"""
+    global _key_source
+    if _key_source is None:
+        with _key_source_lock:
+            if _key_source is None:
+                source_class = import_string(getattr(
+                    settings, 'GOOGLE_ID_TOKEN_KEY_SOURCE', 'api.google_auth.GoogleCertsKeySource'
+                ))
+                # Pas de cache disque par défaut (jamais dans un répertoire partagé comme /tmp)
+                cache_file = getattr(settings, 'GOOGLE_CERTS_CACHE_FILE', '') or None
+                _key_source = source_class(cache_file=cache_file)
+    return _key_source
+
+
+def set_key_source(source):
+    """Remplacer la source des certificats (par exemple StaticKeySource dans les tests)"""
+    global _key_source
+    with _key_source_lock:
+        _key_source = source
+
+
+def verify_google_id_token(credential):
+    """
+    Vérifie localement un id_token Google et retourne ses claims
+    (sub, email, given_name, family_name, picture...)
+    """
+    audience = getattr(settings, 'GOOGLE_OAUTH_CLIENT_ID', None)
+    if not audience:
+        # Sans audience, un id_token émis pour n'importe quel autre client Google serait accepté
+        raise ImproperlyConfigured('GOOGLE_OAUTH_CLIENT_ID doit être configuré pour vérifier les id_tokens Google.')
+    source = get_key_source()
+    try:
+        try:
+            claims = google_jwt.decode(credential, certs=source.get_certs(), audience=audience)
+        except google_exceptions.MalformedError as e:
+            # Clé inconnue : Google a peut-être fait tourner ses clés, on recharge une fois
+            if 'key id' not in str(e):
+                raise
+            claims = google_jwt.decode(credential, certs=source.get_certs(force_refresh=True), audience=audience)
+    except (google_exceptions.GoogleAuthError, ValueError) as e:
+        raise GoogleTokenError(str(e)) from e
+
+    if claims.get('iss') not in GOOGLE_ISSUERS:
+        raise GoogleTokenError(f"Émetteur invalide: {claims.get('iss')}")
+    if claims.get('email_verified') not in (True, 'true'):
+        raise GoogleTokenError('Adresse email non vérifiée par Google.')
+    return claims
+
+
+async def averify_google_id_token(credential):
+    """
+    Version asynchrone de verify_google_id_token. La vérification est locale
+    (CPU) : elle est déportée dans un thread pour ne pas bloquer la boucle.
+    """
+    return await sync_to_async(verify_google_id_token, thread_sensitive=False)(credential)
+
+
+_userinfo_cache = None
+
+
+def _get_userinfo_cache():
+    global _userinfo_cache
+    if _userinfo_cache is None:
+        _userinfo_cache = TTLLRUCache(
+            max_entries=getattr(settings, 'GOOGLE_USERINFO_CACHE_MAX_ENTRIES', 1000),
+            default_ttl=getattr(settings, 'GOOGLE_USERINFO_CACHE_TTL', 60),
+        )
+    return _userinfo_cache
+
+
+def ensure_verified_email(userinfo):
+    """Refuse un profil userinfo dont l'email n'est pas vérifié par Google"""
+    if userinfo.get('verified_email') is not True:
+        raise GoogleTokenError('Adresse email non vérifiée par Google.')
+
+
+def _userinfo_cache_key(access_token):
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+
+def fetch_google_userinfo(access_token):
+    """Profil Google associé à un access_token, mis en cache brièvement par empreinte du token"""
+    cache = _get_userinfo_cache()
+    cache_key = _userinfo_cache_key(access_token)
+    userinfo = cache.get(cache_key)
+    if userinfo is not None:
+        return userinfo
+
+    response = get_http_client().get(
+        GOOGLE_USERINFO_URL,
+        headers={'Authorization': f'Bearer {access_token}'},
+    )
+    if response.status_code != 200:
+        raise GoogleTokenError(f'Userinfo Google: HTTP {response.status_code}')
+
+    userinfo = response.json()
+    ensure_verified_email(userinfo)
+    cache.set(cache_key, userinfo)
+    return userinfo
+
+
+async def afetch_google_userinfo(access_token):
+    """Version asynchrone de fetch_google_userinfo (client httpx partagé)"""
+    cache = _get_userinfo_cache()
+    cache_key = _userinfo_cache_key(access_token)
+    userinfo = cache.get(cache_key)
+    if userinfo is not None:
+        return userinfo
+
+    response = await get_async_http_client().get(
+        GOOGLE_USERINFO_URL,
+        headers={'Authorization': f'Bearer {access_token}'},
+    )
+    if response.status_code != 200:
+        raise GoogleTokenError(f'Userinfo Google: HTTP {response.status_code}')
+
+    userinfo = response.json()
+    ensure_verified_email(userinfo)
+    cache.set(cache_key, userinfo)
+    return userinfo
@@ -0,0 +1,126 @@
+"""
+Registre des clients Google Cloud (Speech-to-Text, Translation)
+
+Les credentials sont résolus une seule fois par processus et les clients sont
+construits à la première utilisation (ou au démarrage si GOOGLE_CLIENTS_EAGER_INIT),
+puis réutilisés par toutes les requêtes : les canaux gRPC/HTTP restent ouverts.
+Les clients Google Cloud sont thread-safe.
+"""
+import logging
+import os
+import threading
+
+from decouple import config
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_UNRESOLVED = object()
+
+
+def resolve_credentials_path():
+    """
+    Chemin du fichier JSON du compte de service, ou None pour utiliser les
+    Application Default Credentials
+    """
+    # Option 1: Variable d'environnement GOOGLE_APPLICATION_CREDENTIALS
+    # Option 2: Chemin vers le fichier JSON dans les settings
+    credentials_path = config('GOOGLE_APPLICATION_CREDENTIALS', default='')
+    if not credentials_path and hasattr(settings, 'GOOGLE_APPLICATION_CREDENTIALS'):
+        credentials_path = settings.GOOGLE_APPLICATION_CREDENTIALS
+
+    # Si le chemin n'est pas absolu, essayer de le trouver dans le dossier du projet
+    if credentials_path and not os.path.isabs(credentials_path):
+        potential_path = os.path.join(settings.BASE_DIR, credentials_path)
+        if os.path.exists(potential_path):
+            credentials_path = potential_path
+        elif os.path.exists(os.path.join(settings.BASE_DIR, os.path.basename(credentials_path))):
+            credentials_path = os.path.join(settings.BASE_DIR, os.path.basename(credentials_path))
+
+    # Si toujours pas trouvé, chercher le fichier JSON dans BASE_DIR
+    if not credentials_path or not os.path.exists(credentials_path):
+        json_files = [f for f in os.listdir(settings.BASE_DIR) if f.endswith('.json') and 'aerial' in f.lower()]
+        if json_files:
+            credentials_path = os.path.join(settings.BASE_DIR, json_files[0])
+
+    if credentials_path and os.path.exists(credentials_path):
+        return credentials_path
+    return None
+
+
+class GoogleClientRegistry:
+    """Credentials et clients Google Cloud partagés par le processus"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._credentials = _UNRESOLVED
+        self._speech_client = None
+        self._translate_client = None
+
+    def get_credentials(self):
+        """Credentials du compte de service, ou None pour les credentials par défaut"""
+        if self._credentials is _UNRESOLVED:
+            with self._lock:
+                if self._credentials is _UNRESOLVED:
+                    credentials_path = resolve_credentials_path()
+                    if credentials_path:
+                        from google.oauth2 import service_account
+                        self._credentials = service_account.Credentials.from_service_account_file(credentials_path)
+                        logger.info(f'Google Cloud: Utilisation des credentials depuis {credentials_path}')
+                    else:
+                        logger.warning('Google Cloud: Credentials non trouvés, utilisation des credentials par défaut')
+                        self._credentials = None
+        return self._credentials
+
+    def get_speech_client(self):
+        if self._speech_client is None:
+            with self._lock:
+                if self._speech_client is None:
+                    from google.cloud import speech
+                    self._speech_client = speech.SpeechClient(credentials=self.get_credentials())
+        return self._speech_client
+
+    def get_translate_client(self):
+        if self._translate_client is None:
+            with self._lock:
+                if self._translate_client is None:
+                    from google.cloud import translate_v2 as translate
+                    self._translate_client = translate.Client(credentials=self.get_credentials())
+        return self._translate_client
+
+    def warm_up(self):
+        """Construire les clients à l'avance (appelé depuis AppConfig.ready)"""
+        for factory in (self.get_speech_client, self.get_translate_client):
+            try:
+                factory()
+            except Exception as e:
+                logger.warning(f'Google Cloud: Initialisation anticipée impossible: {str(e)}')
+
+    def reset(self):
+        """Oublier credentials et clients, par exemple après une rotation des credentials"""
+        with self._lock:
+            speech_client = self._speech_client
+            self._credentials = _UNRESOLVED
+            self._speech_client = None
+            self._translate_client = None
+        transport = getattr(speech_client, 'transport', None)
+        if transport is not None:
+            try:
+                transport.close()
+            except Exception:
+                pass
+
+
+registry = GoogleClientRegistry()
+
+
+def get_speech_client():
+    return registry.get_speech_client()
+
+
+def get_translate_client():
+    return registry.get_translate_client()
+
+
+def reset_google_clients():
+    registry.reset()
@@ -0,0 +1,233 @@
+"""
+Client HTTP partagé pour les appels sortants (Google OAuth, certificats...)
+
+Une seule requests.Session par processus : les connexions sont réutilisées
+(keep-alive, un pool par hôte), chaque appel a un timeout de connexion et de
+lecture, et les appels idempotents sont relancés avec un backoff exponentiel
+plus une part aléatoire (jitter).
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULTS = {
+    'POOL_CONNECTIONS': 10,  # nombre d'hôtes gardés en cache
+    'POOL_MAXSIZE': 20,  # connexions par hôte
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'RETRIES': 3,
+    'BACKOFF_FACTOR': 0.3,
+    'BACKOFF_JITTER': 0.3,
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+class JitteredRetry(Retry):
+    """Retry urllib3 avec un délai aléatoire ajouté au backoff exponentiel"""
+
+    backoff_jitter_max = 0.0
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        return backoff + random.uniform(0, self.backoff_jitter_max)
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.backoff_jitter_max = self.backoff_jitter_max
+        return retry
+
+
+class HTTPStatsMixin:
+    """Compteurs par hôte : requêtes, erreurs, retries et latence"""
+
+    def _init_stats(self):
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, host, elapsed, retries, failed):
+        with self._stats_lock:
+            host_stats = self._stats.setdefault(host, {
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'total_latency_ms': 0.0,
+                'max_latency_ms': 0.0,
+            })
+            latency_ms = elapsed * 1000
+            host_stats['requests'] += 1
+            host_stats['errors'] += int(failed)
+            host_stats['retries'] += retries
+            host_stats['total_latency_ms'] += latency_ms
+            host_stats['max_latency_ms'] = max(host_stats['max_latency_ms'], latency_ms)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {host: dict(values) for host, values in self._stats.items()}
+        for host_stats in stats.values():
+            host_stats['avg_latency_ms'] = host_stats['total_latency_ms'] / max(host_stats['requests'], 1)
+        return stats
+
+
+class OutboundHTTPClient(HTTPStatsMixin):
+    """Session HTTP poolée avec timeouts, retries et statistiques"""
+
+    def __init__(self, options=None):
+        self.options = dict(DEFAULTS)
+        self.options.update(options or {})
+        self.timeout = (self.options['CONNECT_TIMEOUT'], self.options['READ_TIMEOUT'])
+
+        retry = JitteredRetry(
+            total=self.options['RETRIES'],
+            backoff_factor=self.options['BACKOFF_FACTOR'],
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        retry.backoff_jitter_max = self.options['BACKOFF_JITTER']
+
+        self.adapter = HTTPAdapter(
+            pool_connections=self.options['POOL_CONNECTIONS'],
+            pool_maxsize=self.options['POOL_MAXSIZE'],
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self._init_stats()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        started = time.monotonic()
+        retries = 0
+        failed = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            retry_state = getattr(response.raw, 'retries', None)
+            retries = len(retry_state.history) if retry_state is not None else 0
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self._record(host, time.monotonic() - started, retries, failed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Statistiques par hôte : requêtes, erreurs, retries, latence et état du pool"""
+        stats = super().stats()
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f'{pool.host}:{pool.port}'
+            stats.setdefault(host, {})['pool'] = {
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'available_slots': pool.pool.qsize() if pool.pool is not None else 0,
+                'maxsize': pool.pool.maxsize if pool.pool is not None else 0,
+            }
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Client HTTP sortant du processus, configuré par OUTBOUND_HTTP"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OutboundHTTPClient(getattr(settings, 'OUTBOUND_HTTP', {}))
+    return _client
+
+
+class AsyncOutboundHTTPClient(HTTPStatsMixin):
+    """
+    Équivalent asynchrone (httpx.AsyncClient) pour les vues ASGI : mêmes timeouts,
+    même politique de retry avec jitter, connexions limitées par hôte.
+    """
+
+    def __init__(self, options=None):
+        import httpx
+
+        self.options = dict(DEFAULTS)
+        self.options.update(options or {})
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.options['READ_TIMEOUT'], connect=self.options['CONNECT_TIMEOUT']),
+            limits=httpx.Limits(
+                max_connections=self.options['POOL_CONNECTIONS'] * self.options['POOL_MAXSIZE'],
+                max_keepalive_connections=self.options['POOL_MAXSIZE'],
+            ),
+        )
+        self._init_stats()
+
+    def _backoff(self, attempt):
+        if attempt < 1:
+            return 0
+        return self.options['BACKOFF_FACTOR'] * (2 ** (attempt - 1)) + random.uniform(0, self.options['BACKOFF_JITTER'])
+
+    async def request(self, method, url, **kwargs):
+        import httpx
+
+        host = urlsplit(url).netloc
+        retryable = method.upper() in IDEMPOTENT_METHODS
+        started = time.monotonic()
+        attempt = 0
+        failed = True
+        try:
+            while True:
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    if not retryable or attempt >= self.options['RETRIES']:
+                        raise
+                else:
+                    if not (retryable and response.status_code in RETRY_STATUSES
+                            and attempt < self.options['RETRIES']):
+                        failed = response.status_code >= 500
+                        return response
+                attempt += 1
+                await asyncio.sleep(self._backoff(attempt))
+        finally:
+            self._record(host, time.monotonic() - started, attempt, failed)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+
+# Un client asynchrone par boucle d'événements : les connexions httpx y sont liées
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    """Client HTTP sortant asynchrone pour la boucle courante (nécessite httpx)"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOutboundHTTPClient(getattr(settings, 'OUTBOUND_HTTP', {}))
+    return client
@@ -0,0 +1,370 @@
+"""
+Transcriptions longues en arrière-plan
+
+L'audio envoyé est écrit sur le disque local et une ligne TranscriptionJob est
+créée (statut pending). Un worker par processus réclame les tâches en attente
+dans la base (mise à jour conditionnelle du statut, sûre entre plusieurs
+processus) et les exécute sur un pool de threads borné par CONCURRENCY :
+- jusqu'à INLINE_MAX_BYTES, un seul long_running_recognize ;
+- au-delà, pour un WAV (normalisé en LINEAR16 16 kHz par api/audio.py),
+  découpage en morceaux de CHUNK_SECONDS reconnus l'un après l'autre puis concaténés.
+Le worker signale son activité (heartbeat_at) au démarrage puis après chaque
+morceau : une tâche sans signe de vie depuis 2 x OPERATION_TIMEOUT est relancée,
+et l'exécution qu'elle remplace s'arrête au morceau suivant sans écrire de résultat.
+Les tâches terminées sont conservées RETENTION secondes, l'audio est supprimé
+dès la fin du traitement. Le worker tourne dans le processus web (EMBEDDED_WORKER)
+ou dans un processus dédié : `python manage.py run_transcription_worker`.
+"""
+import io
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import uploads
+from .models import TranscriptionJob
+from .audio import RAW_PCM_CONTENT_TYPE, WAV_CONTENT_TYPES, base_content_type, prepare_audio
+from .speech import build_prepared_config, build_transcription_response, long_running_recognize
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'STORAGE_DIR': '',  # par défaut : <tempdir>/kach_transcription_jobs
+    'MAX_UPLOAD_BYTES': 100 * 1024 * 1024,
+    'INLINE_MAX_BYTES': 10 * 1024 * 1024,  # limite Google pour l'audio envoyé dans la requête
+    'CHUNK_SECONDS': 300,
+    'CONCURRENCY': 2,  # tâches exécutées en parallèle par worker
+    'MAX_PENDING': 100,  # au-delà, les nouveaux envois sont refusés
+    'POLL_INTERVAL': 5,
+    'OPERATION_TIMEOUT': 3600,  # attente maximale d'une opération Google (secondes)
+    'MAX_ATTEMPTS': 2,
+    'RETENTION': 7 * 24 * 3600,  # conservation des tâches terminées (secondes)
+    'CLEANUP_INTERVAL': 3600,
+    'EMBEDDED_WORKER': True,  # False : tâches traitées par `manage.py run_transcription_worker`
+}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class UnsupportedLongAudio(Exception):
+    pass
+
+
+class JobSuperseded(Exception):
+    """La tâche a été relancée (ou terminée) par ailleurs : cette exécution s'arrête"""
+
+
+def get_jobs_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'SPEECH_JOBS', {}))
+    if not options['STORAGE_DIR']:
+        options['STORAGE_DIR'] = os.path.join(tempfile.gettempdir(), 'kach_transcription_jobs')
+    return options
+
+
+def iter_wav_chunks(audio_content, chunk_seconds):
+    """Découpe un WAV en WAV plus courts (mêmes paramètres), sans décoder les échantillons"""
+    with wave.open(io.BytesIO(audio_content), 'rb') as reader:
+        params = reader.getparams()
+        frames_per_chunk = max(int(params.framerate * chunk_seconds), 1)
+        while True:
+            frames = reader.readframes(frames_per_chunk)
+            if not frames:
+                return
+            buffer = io.BytesIO()
+            with wave.open(buffer, 'wb') as writer:
+                writer.setparams(params)
+                writer.writeframes(frames)
+            yield buffer.getvalue()
+
+
+def iter_pcm_chunks(audio, chunk_seconds):
+    """Découpe du LINEAR16 brut (mono, 16 bits) en morceaux de chunk_seconds"""
+    step = int(audio.sample_rate_hertz * chunk_seconds) * 2
+    view = memoryview(audio.content)
+    for offset in range(0, len(view), step):
+        yield bytes(view[offset:offset + step])
+
+
+def ensure_long_audio_supported(size_bytes, content_type, options=None):
+    """
+    Au-delà de INLINE_MAX_BYTES, seul le WAV (ou le PCM brut) peut être découpé :
+    refuser les autres formats dès l'envoi plutôt qu'à l'exécution de la tâche
+    """
+    options = options or get_jobs_settings()
+    if size_bytes <= options['INLINE_MAX_BYTES']:
+        return
+    kind = base_content_type(content_type)
+    if kind not in WAV_CONTENT_TYPES and kind != RAW_PCM_CONTENT_TYPE:
+        raise UnsupportedLongAudio(
+            f'Audio de plus de {options["INLINE_MAX_BYTES"] // (1024 * 1024)}MB : '
+            'seul le format WAV peut être découpé.'
+        )
+
+
+def run_long_recognition(audio_content, content_type, options, heartbeat=None):
+    """
+    Reconnaissance d'un audio long, retourne la réponse au format de transcribe_audio.
+    heartbeat est appelé après chaque morceau reconnu.
+    """
+    audio = prepare_audio(audio_content, content_type)
+    recognition_config = build_prepared_config(audio)
+    timeout = options['OPERATION_TIMEOUT']
+
+    if audio.content_type == RAW_PCM_CONTENT_TYPE:
+        chunks = iter_pcm_chunks(audio, options['CHUNK_SECONDS'])
+    elif base_content_type(audio.content_type) in WAV_CONTENT_TYPES:
+        chunks = iter_wav_chunks(audio.content, options['CHUNK_SECONDS'])
+    else:
+        chunks = None
+
+    if len(audio.content) <= options['INLINE_MAX_BYTES']:
+        transcriptions, detected_language = long_running_recognize(audio.content, recognition_config, timeout)
+    elif chunks is not None:
+        transcriptions = []
+        detected_language = 'ar-MA'
+        for chunk in chunks:
+            chunk_transcriptions, chunk_language = long_running_recognize(chunk, recognition_config, timeout)
+            if not transcriptions and chunk_transcriptions:
+                detected_language = chunk_language
+            transcriptions.extend(chunk_transcriptions)
+            if heartbeat is not None:
+                heartbeat()
+    else:
+        raise UnsupportedLongAudio(
+            f'Audio de plus de {options["INLINE_MAX_BYTES"] // (1024 * 1024)}MB : '
+            'seul le format WAV peut être découpé.'
+        )
+
+    response_data = build_transcription_response(transcriptions, detected_language)
+    if transcriptions:
+        # Pour un audio long, le texte complet est la concaténation des segments
+        response_data['full_text'] = ' '.join(t['text'] for t in transcriptions if t['text'])
+    return response_data
+
+
+class TranscriptionWorker(threading.Thread):
+    """Réclame les tâches en attente et les exécute sur un pool de threads borné"""
+
+    def __init__(self, options):
+        super().__init__(name='transcription-worker', daemon=True)
+        self.options = options
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.executor = ThreadPoolExecutor(max_workers=options['CONCURRENCY'], thread_name_prefix='transcription-job')
+        self.slots = threading.BoundedSemaphore(options['CONCURRENCY'])
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._last_cleanup = 0
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self._requeue_stalled()
+                while self.slots.acquire(blocking=False):
+                    job_id = self._claim()
+                    if job_id is None:
+                        self.slots.release()
+                        break
+                    self.executor.submit(self._execute, job_id)
+                self._maybe_cleanup()
+                # Uploads reprenables expirés : purgés même sans nouvel upload
+                uploads.maybe_purge_stale_uploads(uploads.get_uploads_settings())
+            except Exception as e:
+                logger.error(f'Worker de transcription: {str(e)}')
+            finally:
+                connection.close()
+            self._wakeup.wait(self.options['POLL_INTERVAL'])
+            self._wakeup.clear()
+
+    def _claim(self):
+        """Passe la plus ancienne tâche en attente à running ; None s'il n'y en a pas"""
+        pending = TranscriptionJob.objects.filter(status=TranscriptionJob.STATUS_PENDING).order_by('created_at')
+        for job_id in pending.values_list('pk', flat=True)[:5]:
+            claimed = TranscriptionJob.objects.filter(pk=job_id, status=TranscriptionJob.STATUS_PENDING).update(
+                status=TranscriptionJob.STATUS_RUNNING,
+                attempts=F('attempts') + 1,
+                worker=self.worker_id,
+                started_at=timezone.now(),
+                heartbeat_at=timezone.now(),
+            )
+            if claimed:
+                return job_id
+        return None
+
+    def _requeue_stalled(self):
+        """
+        Tâches running sans signe de vie au-delà du délai maximal (worker arrêté) : relancées ou échouées.
+        Chaque morceau est borné par OPERATION_TIMEOUT et suivi d'un heartbeat : une tâche saine
+        de plusieurs morceaux n'est pas considérée comme bloquée.
+        """
+        limit = timezone.now() - timedelta(seconds=self.options['OPERATION_TIMEOUT'] * 2)
+        stalled = TranscriptionJob.objects.filter(
+            Q(heartbeat_at__lt=limit) | Q(heartbeat_at__isnull=True, started_at__lt=limit),
+            status=TranscriptionJob.STATUS_RUNNING,
+        )
+        stalled.filter(attempts__lt=self.options['MAX_ATTEMPTS']).update(status=TranscriptionJob.STATUS_PENDING)
+        stalled.update(
+            status=TranscriptionJob.STATUS_FAILED,
+            error='Délai de traitement dépassé.',
+            finished_at=timezone.now(),
+        )
+
+    def _execute(self, job_id):
+        try:
+            job = TranscriptionJob.objects.get(pk=job_id)
+            # Cette exécution : chaque réclamation (dont la relance d'une tâche jugée bloquée) incrémente attempts
+            current = TranscriptionJob.objects.filter(
+                pk=job_id, status=TranscriptionJob.STATUS_RUNNING, attempts=job.attempts,
+            )
+
+            def heartbeat():
+                if not current.update(heartbeat_at=timezone.now()):
+                    raise JobSuperseded(f'Tâche de transcription {job_id} relancée par ailleurs')
+
+            try:
+                with open(job.audio_path, 'rb') as f:
+                    audio_content = f.read()
+                result = run_long_recognition(audio_content, job.content_type, self.options, heartbeat)
+            except JobSuperseded as e:
+                logger.warning(str(e))
+                return
+            except Exception as e:
+                logger.error(f'Tâche de transcription {job_id}: {str(e)}')
+                finished = current.update(
+                    status=TranscriptionJob.STATUS_FAILED,
+                    error=f'Erreur lors de la transcription: {str(e)}',
+                    finished_at=timezone.now(),
+                )
+            else:
+                finished = current.update(
+                    status=TranscriptionJob.STATUS_SUCCEEDED,
+                    result=result,
+                    finished_at=timezone.now(),
+                )
+            # Une exécution remplacée laisse l'audio à celle qui l'a relancée
+            if finished:
+                remove_audio(job.audio_path)
+        except Exception as e:
+            logger.error(f'Tâche de transcription {job_id}: {str(e)}')
+        finally:
+            connection.close()
+            self.slots.release()
+            self.notify()
+
+    def _maybe_cleanup(self):
+        now = timezone.now().timestamp()
+        if now - self._last_cleanup < self.options['CLEANUP_INTERVAL']:
+            return
+        self._last_cleanup = now
+        purge_finished_jobs(self.options['RETENTION'])
+
+
+def remove_audio(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def purge_finished_jobs(retention):
+    """Supprime les tâches terminées depuis plus de retention secondes"""
+    expired = TranscriptionJob.objects.filter(
+        status__in=[TranscriptionJob.STATUS_SUCCEEDED, TranscriptionJob.STATUS_FAILED],
+        finished_at__lt=timezone.now() - timedelta(seconds=retention),
+    )
+    for path in expired.exclude(audio_path='').values_list('audio_path', flat=True):
+        remove_audio(path)
+    deleted, _ = expired.delete()
+    return deleted
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_transcription_worker():
+    """Worker du processus, démarré à la première utilisation"""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = TranscriptionWorker(get_jobs_settings())
+                _worker.start()
+    return _worker
+
+
+def _enqueue(write_audio, size_bytes, content_type, user):
+    options = get_jobs_settings()
+    ensure_long_audio_supported(size_bytes, content_type, options)
+    pending = TranscriptionJob.objects.filter(status=TranscriptionJob.STATUS_PENDING).count()
+    if pending >= options['MAX_PENDING']:
+        raise JobQueueFull('Trop de transcriptions en attente, réessayez plus tard.')
+
+    os.makedirs(options['STORAGE_DIR'], exist_ok=True)
+    job_id = uuid.uuid4()
+    audio_path = os.path.join(options['STORAGE_DIR'], f'{job_id.hex}.audio')
+    write_audio(audio_path)
+
+    job = TranscriptionJob.objects.create(
+        id=job_id,
+        user=user if user is not None and user.is_authenticated else None,
+        content_type=content_type,
+        audio_path=audio_path,
+        size_bytes=size_bytes,
+    )
+    if options['EMBEDDED_WORKER']:
+        get_transcription_worker().notify()
+    return job
+
+
+def enqueue_transcription(uploaded_file, content_type, user=None):
+    """
+    Écrit l'audio sur le disque et crée la tâche ; lève JobQueueFull si la file est pleine,
+    UnsupportedLongAudio si l'audio est trop long pour être découpé
+    """
+    def write_audio(audio_path):
+        with open(audio_path, 'wb') as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+
+    return _enqueue(write_audio, uploaded_file.size, content_type, user)
+
+
+def link_or_copy(source, destination):
+    """Lien physique (sans copie) si le fichier est sur le même volume, copie sinon"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def enqueue_transcription_file(path, content_type, user=None, keep_source=False):
+    """
+    Crée la tâche à partir d'un fichier déjà sur le disque, déplacé (sans copie sur le même volume),
+    ou lié si keep_source : le fichier d'origine reste en place pour son propriétaire
+    """
+    write_audio = (lambda audio_path: link_or_copy(path, audio_path)) if keep_source else (
+        lambda audio_path: shutil.move(path, audio_path)
+    )
+    return _enqueue(write_audio, os.path.getsize(path), content_type, user)
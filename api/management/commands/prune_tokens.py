@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.pruning import prune_expired_tokens, compact_token_tables
+
+
+class Command(BaseCommand):
+    help = 'Supprime par lots les OutstandingToken et BlacklistedToken expirés'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'TOKEN_PRUNING_BATCH_SIZE', 500),
+                            help='Nombre de tokens supprimés par lot')
+        parser.add_argument('--throttle', type=float, default=getattr(settings, 'TOKEN_PRUNING_THROTTLE', 0.1),
+                            help='Pause en secondes entre deux lots')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Nombre maximal de lots pour cette exécution')
+        parser.add_argument('--compact', action='store_true',
+                            help='Lancer un VACUUM des tables après la purge')
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options['verbosity'] >= 2:
+                self.stdout.write(
+                    f"Lot {stats['batches']}: {stats['outstanding_deleted']} outstanding, "
+                    f"{stats['blacklisted_deleted']} blacklistés ({stats['elapsed']:.2f}s)"
+                )
+
+        stats = prune_expired_tokens(
+            batch_size=options['batch_size'],
+            throttle=options['throttle'],
+            max_batches=options['max_batches'],
+            progress=progress,
+        )
+        if options['compact']:
+            compact_token_tables()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['outstanding_deleted']} outstanding et {stats['blacklisted_deleted']} blacklistés "
+            f"supprimés en {stats['batches']} lots ({stats['elapsed']:.2f}s)"
+        ))
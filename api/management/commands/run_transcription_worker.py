@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import get_transcription_worker
+
+
+class Command(BaseCommand):
+    help = 'Traite les tâches de transcription en attente (worker dédié)'
+
+    def handle(self, *args, **options):
+        worker = get_transcription_worker()
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker {worker.worker_id} démarré ({worker.options['CONCURRENCY']} tâches en parallèle)"
+        ))
+        try:
+            while worker.is_alive():
+                worker.join(timeout=1)
+        except KeyboardInterrupt:
+            worker.stop()
@@ -0,0 +1,76 @@
+"""
+Middlewares de l'API
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+# Marge pour les en-têtes multipart et les champs de formulaire autour du fichier
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def get_request_size_limits():
+    """Taille maximale du corps par préfixe d'URL (le plus long préfixe correspondant s'applique)"""
+    limits = {
+        '/api/speech/transcribe/': 10 * 1024 * 1024 + MULTIPART_OVERHEAD,
+        '/api/speech/transcribe/batch/': (
+            getattr(settings, 'SPEECH_BATCH', {}).get('MAX_TOTAL_BYTES', 50 * 1024 * 1024) + MULTIPART_OVERHEAD
+        ),
+        '/api/speech/jobs/': (
+            getattr(settings, 'SPEECH_JOBS', {}).get('MAX_UPLOAD_BYTES', 100 * 1024 * 1024) + MULTIPART_OVERHEAD
+        ),
+        '/api/speech/uploads/': getattr(settings, 'SPEECH_UPLOADS', {}).get('MAX_CHUNK_BYTES', 8 * 1024 * 1024),
+    }
+    limits.update(getattr(settings, 'REQUEST_SIZE_LIMITS', {}))
+    return sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Refuse (413) les requêtes dont le Content-Length dépasse la limite de l'endpoint,
+    avant toute lecture ou analyse du corps (multipart compris).
+    Compatible sync et async : sous ASGI, les vues async ne passent pas par un thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = get_request_size_limits()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.check_size(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.check_size(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
+
+    def check_size(self, request):
+        content_length = request.META.get('CONTENT_LENGTH')
+        if not content_length:
+            return None
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            return JsonResponse({'error': 'En-tête Content-Length invalide.'}, status=400)
+
+        for prefix, limit in self.limits:
+            if request.path.startswith(prefix):
+                if content_length > limit:
+                    return JsonResponse(
+                        {'error': f'Requête trop volumineuse (max {limit // (1024 * 1024)}MB).'},
+                        status=413,
+                        json_dumps_params={'ensure_ascii': False},
+                    )
+                break
+        return None
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_user_avatar_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='tokens_valid_after',
+            field=models.DateTimeField(blank=True, help_text='Les tokens émis avant cette date sont révoqués', null=True),
+        ),
+    ]
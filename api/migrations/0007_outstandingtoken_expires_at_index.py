@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index sur token_blacklist_outstandingtoken.expires_at pour la purge par lots
+    (le modèle appartient à simplejwt, l'index est donc créé en SQL brut)
+    """
+
+    dependencies = [
+        ('api', '0006_user_tokens_valid_after'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS api_outstandingtoken_expires_at_idx '
+                'ON token_blacklist_outstandingtoken (expires_at);',
+            reverse_sql='DROP INDEX IF EXISTS api_outstandingtoken_expires_at_idx;',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+        ('api', '0007_outstandingtoken_expires_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutstandingTokenDigest',
+            fields=[
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='digest', serialize=False, to='token_blacklist.outstandingtoken')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Empreinte de token',
+                'verbose_name_plural': 'Empreintes de tokens',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+import hashlib
+
+from django.db import migrations
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_digests(apps, schema_editor):
+    OutstandingToken = apps.get_model('token_blacklist', 'OutstandingToken')
+    OutstandingTokenDigest = apps.get_model('api', 'OutstandingTokenDigest')
+
+    batch = []
+    tokens = OutstandingToken.objects.filter(digest__isnull=True).values_list('pk', 'token')
+    for pk, token in tokens.iterator(chunk_size=BATCH_SIZE):
+        batch.append(OutstandingTokenDigest(
+            token_id=pk,
+            digest=hashlib.sha256(token.encode('utf-8')).hexdigest(),
+        ))
+        if len(batch) >= BATCH_SIZE:
+            OutstandingTokenDigest.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        OutstandingTokenDigest.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_outstandingtokendigest'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_digests, migrations.RunPython.noop),
+    ]
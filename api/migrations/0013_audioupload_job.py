@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_audioupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audioupload',
+            name='job',
+            field=models.ForeignKey(blank=True, help_text='Tâche lancée par la finalisation (renvoyée si la finalisation est répétée)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.transcriptionjob'),
+        ),
+    ]
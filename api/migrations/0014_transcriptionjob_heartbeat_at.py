@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_audioupload_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Dernier signe de vie du worker (démarrage, puis après chaque morceau)', null=True),
+        ),
+    ]
@@ -1,3 +1,7 @@
+import hashlib
+import uuid
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -8,6 +12,7 @@ class User(AbstractUser):
     phone = models.CharField(max_length=20, blank=True, null=True)
     google_id = models.CharField(max_length=255, unique=True, blank=True, null=True, help_text="ID Google OAuth")
     avatar_url = models.URLField(max_length=500, blank=True, null=True, help_text="URL de l'image de profil Google")
+    tokens_valid_after = models.DateTimeField(blank=True, null=True, help_text="Les tokens émis avant cette date sont révoqués")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -18,3 +23,107 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+
+
+class OutstandingTokenDigest(models.Model):
+    """Empreinte SHA-256 d'un OutstandingToken, indexée pour la recherche par token brut"""
+    token = models.OneToOneField(
+        'token_blacklist.OutstandingToken',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='digest',
+    )
+    digest = models.CharField(max_length=64, unique=True)
+    
+    class Meta:
+        verbose_name = 'Empreinte de token'
+        verbose_name_plural = 'Empreintes de tokens'
+    
+    @staticmethod
+    def compute(raw_token):
+        """SHA-256 hexadécimal du token brut (str ou bytes)"""
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode('utf-8')
+        return hashlib.sha256(raw_token).hexdigest()
+    
+    def __str__(self):
+        return self.digest
+
+
+class TranslationCacheEntry(models.Model):
+    """Traduction mise en cache, indexée par l'empreinte du texte source normalisé et de la paire de langues"""
+    key = models.CharField(max_length=64, unique=True)
+    source_language = models.CharField(max_length=10)
+    target_language = models.CharField(max_length=10)
+    source_text = models.TextField()
+    translated_text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Traduction en cache'
+        verbose_name_plural = 'Traductions en cache'
+    
+    def __str__(self):
+        return f'{self.source_language} → {self.target_language}: {self.source_text[:50]}'
+
+
+class TranscriptionJob(models.Model):
+    """Transcription d'un audio long, traitée en arrière-plan par le worker de api/jobs.py"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_SUCCEEDED, 'Terminée'),
+        (STATUS_FAILED, 'Échouée'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True,
+                             related_name='transcription_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    content_type = models.CharField(max_length=100)
+    audio_path = models.CharField(max_length=500, blank=True, help_text="Fichier audio local, supprimé après traitement")
+    size_bytes = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True,
+                                        help_text="Dernier signe de vie du worker (démarrage, puis après chaque morceau)")
+    finished_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Tâche de transcription'
+        verbose_name_plural = 'Tâches de transcription'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='api_job_status_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.id} ({self.status})'
+
+
+class AudioUpload(models.Model):
+    """Upload audio reprenable : les octets sont sur le disque (api/uploads.py), l'offset est la taille du fichier"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True,
+                             related_name='audio_uploads')
+    content_type = models.CharField(max_length=100)
+    size_bytes = models.PositiveIntegerField(help_text="Taille totale annoncée à la création")
+    job = models.ForeignKey(TranscriptionJob, on_delete=models.SET_NULL, blank=True, null=True, related_name='+',
+                            help_text="Tâche lancée par la finalisation (renvoyée si la finalisation est répétée)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Upload audio'
+        verbose_name_plural = 'Uploads audio'
+    
+    def __str__(self):
+        return f'{self.id} ({self.size_bytes} octets)'
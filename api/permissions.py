@@ -0,0 +1,20 @@
+"""
+Permissions de l'API
+"""
+import hmac
+
+from django.conf import settings
+from rest_framework import permissions
+
+
+class IsInternalService(permissions.BasePermission):
+    """
+    Appels entre services : en-tête X-Internal-Token égal à INTERNAL_SERVICE_TOKEN.
+    Sans secret configuré, les endpoints internes sont fermés.
+    """
+    message = 'Accès réservé aux services internes.'
+
+    def has_permission(self, request, view):
+        expected = getattr(settings, 'INTERNAL_SERVICE_TOKEN', '')
+        provided = request.headers.get('X-Internal-Token', '')
+        return bool(expected) and hmac.compare_digest(provided.encode('utf-8'), expected.encode('utf-8'))
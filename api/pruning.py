@@ -0,0 +1,117 @@
+"""
+Purge incrémentale des tables token_blacklist
+
+Les OutstandingToken expirés (et leurs BlacklistedToken) sont supprimés par petits
+lots ordonnés sur expires_at, avec une pause entre les lots, pour pouvoir tourner
+sur une base en production sans verrou long.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+
+def prune_expired_tokens(batch_size=500, throttle=0.1, max_batches=None, progress=None):
+    """
+    Supprime les tokens expirés par lots de `batch_size`, en dormant `throttle` secondes
+    entre deux lots. `progress` est appelé après chaque lot avec les statistiques courantes.
+    Retourne les statistiques finales.
+    """
+    cutoff = timezone.now()
+    stats = {
+        'batches': 0,
+        'outstanding_deleted': 0,
+        'blacklisted_deleted': 0,
+        'elapsed': 0.0,
+    }
+    started = time.monotonic()
+
+    while max_batches is None or stats['batches'] < max_batches:
+        pks = list(
+            OutstandingToken.objects.filter(expires_at__lt=cutoff)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            break
+
+        with transaction.atomic():
+            blacklisted_deleted, _ = BlacklistedToken.objects.filter(token_id__in=pks).delete()
+            outstanding_deleted, _ = OutstandingToken.objects.filter(pk__in=pks).delete()
+
+        stats['batches'] += 1
+        stats['blacklisted_deleted'] += blacklisted_deleted
+        stats['outstanding_deleted'] += outstanding_deleted
+        stats['elapsed'] = time.monotonic() - started
+        if progress:
+            progress(stats)
+
+        if len(pks) < batch_size:
+            break
+        if throttle:
+            time.sleep(throttle)
+
+    stats['elapsed'] = time.monotonic() - started
+    logger.info(
+        f"Purge des tokens: {stats['outstanding_deleted']} outstanding, "
+        f"{stats['blacklisted_deleted']} blacklistés supprimés en {stats['batches']} lots "
+        f"({stats['elapsed']:.2f}s)"
+    )
+    return stats
+
+
+def compact_token_tables():
+    """Récupère l'espace libéré par la purge (VACUUM selon le moteur de base de données)"""
+    tables = [OutstandingToken._meta.db_table, BlacklistedToken._meta.db_table]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for table in tables:
+                cursor.execute(f'VACUUM ANALYZE {connection.ops.quote_name(table)}')
+        elif connection.vendor == 'sqlite':
+            cursor.execute('VACUUM')
+
+
+class TokenPruner(threading.Thread):
+    """Tâche périodique en arrière-plan qui purge les tokens expirés"""
+
+    def __init__(self, interval, **prune_options):
+        super().__init__(name='token-pruner', daemon=True)
+        self.interval = interval
+        self.prune_options = prune_options
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                prune_expired_tokens(**self.prune_options)
+            except Exception as e:
+                logger.error(f'Purge des tokens échouée: {str(e)}')
+            finally:
+                connection.close()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_pruner = None
+
+
+def start_token_pruner():
+    """Démarre la purge périodique si TOKEN_PRUNING_INTERVAL est configuré (en secondes)"""
+    global _pruner
+    interval = getattr(settings, 'TOKEN_PRUNING_INTERVAL', 0)
+    if not interval or _pruner is not None:
+        return None
+    _pruner = TokenPruner(
+        interval,
+        batch_size=getattr(settings, 'TOKEN_PRUNING_BATCH_SIZE', 500),
+        throttle=getattr(settings, 'TOKEN_PRUNING_THROTTLE', 0.1),
+    )
+    _pruner.start()
+    return _pruner
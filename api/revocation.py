@@ -0,0 +1,327 @@
+"""
+Cache de révocation des tokens JWT
+
+Évite les requêtes OutstandingToken/BlacklistedToken à chaque requête authentifiée :
+- un backend (LRU local ou cache Django partagé) mémorise l'état révoqué/non révoqué
+  d'un jti, avec une durée de vie bornée par l'expiration du token ;
+- un filtre de Bloom des jti révoqués permet de conclure "non révoqué" sans
+  toucher à la base de données. Il est complété à chaque blacklist du processus
+  (signal post_save) et reconstruit périodiquement dans un thread d'arrière-plan,
+  dimensionné sur le nombre de jti révoqués, pour voir les blacklists des autres
+  processus ;
+- l'état de révocation de chaque utilisateur (tokens_valid_after, updated_at)
+  est conservé NEGATIVE_TTL secondes pour l'authentification par claims (JWT_LAZY_USER).
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, connections
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .cache import TTLLRUCache
+from .models import User
+from .tokens import EPOCH_CLAIM, timestamp_us
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKEND': 'local',  # 'local' (LRU en mémoire) ou 'shared' (cache Django)
+    'CACHE_ALIAS': 'default',
+    'MAX_ENTRIES': 10000,
+    # Durée maximale pendant laquelle un résultat "non révoqué" est conservé
+    'NEGATIVE_TTL': 60,
+    'BLOOM_CAPACITY': 100000,  # capacité minimale
+    'BLOOM_HEADROOM': 2.0,  # capacité = nombre de jti révoqués x BLOOM_HEADROOM
+    'BLOOM_ERROR_RATE': 0.001,
+    # Intervalle de reconstruction du filtre de Bloom depuis la base (en arrière-plan)
+    'BLOOM_REFRESH_SECONDS': 60,
+    # Au-delà, le filtre est reconstruit pendant la requête (reconstructions en échec)
+    'BLOOM_MAX_STALE_SECONDS': 600,
+}
+
+
+def get_revocation_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'TOKEN_REVOCATION_CACHE', {}))
+    return options
+
+
+class BloomFilter:
+    """Filtre de Bloom simple (double hachage sur un SHA-256)"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        self.count += 1
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class LocalBackend:
+    """Backend en mémoire, propre au processus"""
+
+    def __init__(self, options):
+        self._cache = TTLLRUCache(max_entries=options['MAX_ENTRIES'])
+
+    def get(self, jti):
+        return self._cache.get(jti)
+
+    def set(self, jti, revoked, ttl):
+        self._cache.set(jti, revoked, ttl)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class SharedBackend:
+    """Backend s'appuyant sur un cache Django (Redis, Memcached...) partagé entre processus"""
+
+    key_prefix = 'kach:revoked:'
+
+    def __init__(self, options):
+        self._cache = caches[options['CACHE_ALIAS']]
+
+    def get(self, jti):
+        return self._cache.get(self.key_prefix + jti)
+
+    def set(self, jti, revoked, ttl):
+        self._cache.set(self.key_prefix + jti, revoked, timeout=max(int(ttl), 1))
+
+    def delete(self, key):
+        self._cache.delete(self.key_prefix + key)
+
+    def clear(self):
+        # Les entrées expirent d'elles-mêmes avec les tokens
+        pass
+
+
+BACKENDS = {
+    'local': LocalBackend,
+    'shared': SharedBackend,
+}
+
+
+class RevocationCache:
+    """
+    Point d'entrée unique pour savoir si un jti est révoqué.
+
+    Ordre de résolution : backend -> filtre de Bloom -> base de données.
+    Un jti absent du filtre de Bloom n'est pas révoqué (pas de faux négatifs),
+    seuls les faux positifs du filtre déclenchent une requête.
+    """
+
+    def __init__(self, options=None):
+        self.options = options or get_revocation_settings()
+        self.backend = BACKENDS[self.options['BACKEND']](self.options)
+        self._bloom = None
+        self._bloom_built_at = 0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # jti révoqués pendant une reconstruction, ajoutés au nouveau filtre avant de le publier
+        self._revoked_during_build = None
+
+    def _ttl(self, exp, revoked):
+        remaining = exp - time.time() if exp else self.options['NEGATIVE_TTL']
+        if not revoked:
+            remaining = min(remaining, self.options['NEGATIVE_TTL'])
+        return max(remaining, 1)
+
+    def _build_bloom(self):
+        jtis = list(BlacklistedToken.objects.filter(
+            token__expires_at__gt=timezone.now()
+        ).values_list('token__jti', flat=True).iterator())
+        capacity = max(self.options['BLOOM_CAPACITY'], int(len(jtis) * self.options['BLOOM_HEADROOM']))
+        bloom = BloomFilter(capacity, self.options['BLOOM_ERROR_RATE'])
+        for jti in jtis:
+            bloom.add(jti)
+        return bloom
+
+    def _rebuild_bloom(self):
+        """
+        Reconstruit et publie le filtre (appelant détenteur de _build_lock) ; les révocations
+        survenues pendant la lecture en base y sont reportées
+        """
+        with self._lock:
+            self._revoked_during_build = []
+        try:
+            bloom = self._build_bloom()
+        except Exception:
+            with self._lock:
+                self._revoked_during_build = None
+            raise
+        with self._lock:
+            for jti in self._revoked_during_build:
+                bloom.add(jti)
+            self._revoked_during_build = None
+            self._bloom = bloom
+            self._bloom_built_at = time.monotonic()
+        return bloom
+
+    def _rebuild_bloom_in_background(self):
+        if not self._build_lock.acquire(blocking=False):
+            return  # reconstruction déjà en cours
+
+        def rebuild():
+            # Thread hors du cycle de requête de Django : fermer ses connexions
+            close_old_connections()
+            try:
+                self._rebuild_bloom()
+            except Exception as e:
+                logger.warning(f'Reconstruction du filtre de Bloom des tokens révoqués échouée: {str(e)}')
+            finally:
+                connections.close_all()
+                self._build_lock.release()
+
+        try:
+            threading.Thread(target=rebuild, name='revocation-bloom-rebuild', daemon=True).start()
+        except Exception:
+            self._build_lock.release()
+            raise
+
+    def _is_bloom_usable(self):
+        # Jamais construit (démarrage, reset) ou trop ancien : à construire quelle que soit la valeur de monotonic()
+        return (
+            self._bloom is not None
+            and time.monotonic() - self._bloom_built_at < self.options['BLOOM_MAX_STALE_SECONDS']
+        )
+
+    def _get_bloom(self):
+        if not self._is_bloom_usable():
+            with self._build_lock:
+                if not self._is_bloom_usable():
+                    return self._rebuild_bloom()
+        bloom = self._bloom
+        if (
+            time.monotonic() - self._bloom_built_at >= self.options['BLOOM_REFRESH_SECONDS']
+            or bloom.count > bloom.capacity
+        ):
+            # Le filtre actuel reste utilisé pendant la reconstruction
+            self._rebuild_bloom_in_background()
+        return bloom
+
+    def is_revoked(self, jti, exp=None):
+        cached = self.backend.get(jti)
+        if cached is not None:
+            return cached
+
+        if jti not in self._get_bloom():
+            return False
+
+        revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        self.backend.set(jti, revoked, self._ttl(exp, revoked))
+        return revoked
+
+    def revoked_jtis(self, expirations):
+        """
+        Sous-ensemble révoqué d'un lot {jti: exp} : même résolution que is_revoked,
+        mais une seule requête pour tous les jti que ni le backend ni le filtre de Bloom ne tranchent
+        """
+        revoked = set()
+        unresolved = {}
+        bloom = self._get_bloom()
+        for jti, exp in expirations.items():
+            cached = self.backend.get(jti)
+            if cached is not None:
+                if cached:
+                    revoked.add(jti)
+            elif jti in bloom:
+                unresolved[jti] = exp
+
+        if unresolved:
+            found = set(
+                BlacklistedToken.objects.filter(token__jti__in=list(unresolved)).values_list('token__jti', flat=True)
+            )
+            for jti, exp in unresolved.items():
+                self.backend.set(jti, jti in found, self._ttl(exp, jti in found))
+            revoked |= found
+        return revoked
+
+    def mark_revoked(self, jti, exp=None):
+        """Enregistre la révocation d'un jti (logout, rotation, admin)"""
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+            if self._revoked_during_build is not None:
+                self._revoked_during_build.append(jti)
+        self.backend.set(jti, True, self._ttl(exp, True))
+
+    def get_user_state(self, user_id):
+        """
+        {'tokens_valid_after', 'updated_at'} de l'utilisateur, lu en base au plus une fois
+        par NEGATIVE_TTL ; None si l'utilisateur n'existe pas
+        """
+        key = f'user:{user_id}'
+        state = self.backend.get(key)
+        if state is None:
+            state = User.objects.filter(pk=user_id).values('tokens_valid_after', 'updated_at').first()
+            if state is None:
+                return None
+            self.backend.set(key, state, self.options['NEGATIVE_TTL'])
+        return state
+
+    def invalidate_user(self, user_id):
+        """Oublie l'état de l'utilisateur (profil, mot de passe ou époque de révocation modifiés)"""
+        self.backend.delete(f'user:{user_id}')
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._bloom_built_at = 0
+        self.backend.clear()
+
+
+def issued_before_epoch(token, tokens_valid_after):
+    """
+    Indique si le token (payload décodé) précède l'époque de révocation de l'utilisateur.
+    Le claim EPOCH_CLAIM reprend l'époque en vigueur à l'émission, à la microseconde :
+    un logout révoque exactement les tokens émis avant lui, même dans la même seconde.
+    Pour les tokens sans ce claim, seul le iat (tronqué à la seconde) est disponible :
+    un token émis dans la seconde du logout est considéré comme révoqué.
+    """
+    if tokens_valid_after is None:
+        return False
+    epoch = token.get(EPOCH_CLAIM)
+    if epoch is not None:
+        return epoch < timestamp_us(tokens_valid_after)
+    issued_at = token.get('iat')
+    if issued_at is None:
+        return False
+    return int(issued_at) <= int(tokens_valid_after.timestamp())
+
+
+_revocation_cache = None
+_revocation_cache_lock = threading.Lock()
+
+
+def get_revocation_cache():
+    """Retourne le cache de révocation du processus (créé à la première utilisation)"""
+    global _revocation_cache
+    if _revocation_cache is None:
+        with _revocation_cache_lock:
+            if _revocation_cache is None:
+                _revocation_cache = RevocationCache()
+    return _revocation_cache
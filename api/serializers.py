@@ -1,6 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from .models import User
+from .revocation import issued_before_epoch
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -24,6 +29,17 @@ class UpdateProfileSerializer(serializers.ModelSerializer):
         if User.objects.filter(email=value).exclude(pk=user.pk).exists():
             raise serializers.ValidationError("Cet email est déjà utilisé.")
         return value
+    
+    def update(self, instance, validated_data):
+        """Enregistrer uniquement les champs modifiés (aucune écriture si rien n'a changé)"""
+        self.changed_fields = [
+            field for field, value in validated_data.items() if getattr(instance, field) != value
+        ]
+        for field in self.changed_fields:
+            setattr(instance, field, validated_data[field])
+        if self.changed_fields:
+            instance.save(update_fields=self.changed_fields + ['updated_at'])
+        return instance
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -90,6 +106,21 @@ class ChangePasswordSerializer(serializers.Serializer):
     def save(self):
         user = self.context['request'].user
         user.set_password(self.validated_data['new_password'])
+        # Révoquer les tokens émis avant le changement de mot de passe
+        user.tokens_valid_after = timezone.now()
         user.save()
         return user
 
+
+
+class EpochTokenRefreshSerializer(TokenRefreshSerializer):
+    """Serializer de rafraîchissement qui refuse les refresh tokens émis avant le dernier logout"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        tokens_valid_after = User.objects.filter(
+            pk=refresh.payload.get(api_settings.USER_ID_CLAIM)
+        ).values_list('tokens_valid_after', flat=True).first()
+        if issued_before_epoch(refresh.payload, tokens_valid_after):
+            raise InvalidToken('Token has been revoked.')
+        return super().validate(attrs)
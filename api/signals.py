@@ -0,0 +1,39 @@
+"""
+Signaux de l'application API
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+
+from .models import OutstandingTokenDigest, User
+from .revocation import get_revocation_cache
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def update_revocation_cache(sender, instance, created, **kwargs):
+    """Propager chaque blacklist (logout, rotation du refresh token, admin) au cache de révocation"""
+    if not created:
+        return
+    outstanding_token = instance.token
+    get_revocation_cache().mark_revoked(
+        outstanding_token.jti,
+        outstanding_token.expires_at.timestamp() if outstanding_token.expires_at else None,
+    )
+
+
+@receiver(post_save, sender=OutstandingToken)
+def create_outstanding_token_digest(sender, instance, created, **kwargs):
+    """Maintenir l'empreinte indexée du token brut à chaque insertion"""
+    if not created:
+        return
+    OutstandingTokenDigest.objects.get_or_create(
+        token=instance,
+        defaults={'digest': OutstandingTokenDigest.compute(instance.token)},
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_state(sender, instance, **kwargs):
+    """Les claims des tokens déjà émis ne reflètent plus le compte : oublier l'état en cache"""
+    get_revocation_cache().invalidate_user(instance.pk)
@@ -0,0 +1,436 @@
+"""
+Pipeline de transcription Speech-to-Text (Darija, Français, Anglais)
+
+Partagé par les vues de transcription : construction de la configuration de
+reconnaissance, appel à Google Cloud Speech-to-Text, extraction des transcriptions,
+traduction Darija -> Français et mise en cache du résultat complet.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .audio import RAW_PCM_CONTENT_TYPE, get_normalization_settings, prepare_audio
+from .cache import TTLLRUCache
+from .google_clients import get_speech_client
+from .translation import translate_texts
+from .vad import detect_speech_segments, get_vad_settings, is_silence, pcm_samples
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_LANGUAGES = ['ar-MA', 'fr-FR', 'en-US']
+
+# Mapper les codes de langue pour l'affichage
+LANGUAGE_NAMES = {
+    'ar-MA': 'Darija (Arabe Marocain)',
+    'ar': 'Darija (Arabe Marocain)',
+    'ar-x-maghrebi': 'Darija (Arabe Marocain)',
+    'fr-FR': 'Français',
+    'fr': 'Français',
+    'en-US': 'Anglais',
+    'en': 'Anglais',
+}
+
+
+class SpeechConfigurationError(Exception):
+    """Client Speech-to-Text impossible à initialiser (credentials manquants...)"""
+
+
+def get_client():
+    try:
+        return get_speech_client()
+    except ImportError:
+        raise
+    except Exception as e:
+        raise SpeechConfigurationError(
+            f'Erreur de configuration Google Cloud: {str(e)}. '
+            'Assurez-vous que GOOGLE_APPLICATION_CREDENTIALS est configuré ou que '
+            'les Application Default Credentials sont configurées.'
+        ) from e
+
+
+def build_recognition_config(content_type, sample_rate_hertz=None, audio_channel_count=None):
+    """
+    Configuration de reconnaissance pour un type MIME donné. sample_rate_hertz et
+    audio_channel_count sont ceux lus dans l'en-tête par api/audio.py.
+    """
+    from google.cloud import speech
+
+    # Mapper les types MIME aux encodings Google Cloud Speech
+    encoding_map = {
+        'audio/webm': speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+        'audio/webm;codecs=opus': speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+        'audio/ogg': speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
+        'audio/ogg;codecs=opus': speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
+        'audio/wav': speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        'audio/x-wav': speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        'audio/wave': speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        'audio/mp3': speech.RecognitionConfig.AudioEncoding.MP3,
+        'audio/mpeg': speech.RecognitionConfig.AudioEncoding.MP3,
+        'audio/flac': speech.RecognitionConfig.AudioEncoding.FLAC,
+        RAW_PCM_CONTENT_TYPE: speech.RecognitionConfig.AudioEncoding.LINEAR16,
+    }
+
+    # Utiliser WEBM_OPUS par défaut (format le plus courant pour MediaRecorder)
+    audio_encoding = encoding_map.get(content_type, speech.RecognitionConfig.AudioEncoding.WEBM_OPUS)
+
+    # Configuration de la reconnaissance vocale multilingue
+    # Priorité: 1. Darija (ar-MA), 2. Français (fr-FR), 3. Anglais (en-US)
+    # Pour WEBM_OPUS et OGG_OPUS, on peut omettre sample_rate_hertz pour la détection automatique
+    config_params = {
+        'encoding': audio_encoding,
+        'language_code': 'ar-MA',  # Langue principale: Darija (arabe marocain)
+        'alternative_language_codes': ['fr-FR', 'en-US'],  # Langues secondaires: Français et Anglais
+        'enable_automatic_punctuation': True,
+        'enable_word_confidence': True,
+        'model': 'latest_long',  # Utilise le meilleur modèle pour les enregistrements longs
+        # Alternative: 'phone_call' pour les conversations téléphoniques
+        # 'model': 'phone_call',
+    }
+
+    # Déclarer les paramètres réels lus dans l'en-tête. Inconnus (en-tête illisible,
+    # Opus), ils sont omis : Google les lit dans l'en-tête WAV/FLAC ou le conteneur Opus
+    if sample_rate_hertz:
+        config_params['sample_rate_hertz'] = sample_rate_hertz
+    if audio_channel_count and audio_channel_count > 1:
+        config_params['audio_channel_count'] = audio_channel_count
+
+    return speech.RecognitionConfig(**config_params)
+
+
+def parse_recognition_results(results):
+    """Extraire le texte transcrit avec détection de langue"""
+    transcriptions = []
+    detected_language = 'ar-MA'  # Par défaut: Darija (langue principale)
+
+    for result in results:
+        alternative = result.alternatives[0]
+        transcription_data = {
+            'text': alternative.transcript,
+            'confidence': alternative.confidence,
+        }
+
+        # Essayer de détecter la langue depuis les résultats
+        # Note: Avec alternative_language_codes, Google Cloud peut retourner
+        # la langue détectée dans language_code si disponible
+        if hasattr(result, 'language_code') and result.language_code:
+            transcription_data['detected_language'] = result.language_code
+            # Utiliser la première langue détectée trouvée
+            if detected_language == 'ar-MA':  # Si on n'a pas encore de langue détectée
+                detected_language = result.language_code
+
+        transcriptions.append(transcription_data)
+
+    return transcriptions, detected_language
+
+
+def build_prepared_config(audio):
+    """Configuration de reconnaissance pour un PreparedAudio"""
+    return build_recognition_config(audio.content_type, audio.sample_rate_hertz, audio.channels)
+
+
+def recognize(audio_content, recognition_config):
+    """Appel synchrone à Speech-to-Text, retourne (transcriptions, langue détectée)"""
+    from google.cloud import speech
+
+    client = get_client()
+    # Seule copie de l'audio envoyé : le message protobuf exige des bytes
+    audio = speech.RecognitionAudio(content=bytes(audio_content))
+    response = client.recognize(config=recognition_config, audio=audio)
+    return parse_recognition_results(response.results)
+
+
+def long_running_recognize(audio_content, recognition_config, timeout=None):
+    """Reconnaissance asynchrone côté Google (audio > 1 minute), attend la fin de l'opération"""
+    from google.cloud import speech
+
+    client = get_client()
+    audio = speech.RecognitionAudio(content=bytes(audio_content))
+    operation = client.long_running_recognize(config=recognition_config, audio=audio)
+    response = operation.result(timeout=timeout)
+    return parse_recognition_results(response.results)
+
+
+_segment_executor = None
+_segment_executor_lock = threading.Lock()
+
+
+def get_segment_executor():
+    """Pool de threads partagé pour la reconnaissance des segments (borné par VOICE_ACTIVITY['MAX_WORKERS'])"""
+    global _segment_executor
+    if _segment_executor is None:
+        with _segment_executor_lock:
+            if _segment_executor is None:
+                _segment_executor = ThreadPoolExecutor(
+                    max_workers=get_vad_settings()['MAX_WORKERS'],
+                    thread_name_prefix='speech-segment',
+                )
+    return _segment_executor
+
+
+def recognize_segmented(audio, recognition_config):
+    """
+    Reconnaissance après détection d'activité vocale : le silence est retiré et
+    chaque segment de parole est reconnu en parallèle. Les transcriptions sont
+    remises dans l'ordre, au même format que recognize. Sans PCM décodable
+    (Opus, MP3, FLAC), si la VAD est désactivée, ne trouve aucun segment ou
+    couvre presque tout l'extrait, un seul appel recognize. Seul un extrait sous
+    le seuil absolu de silence n'est pas envoyé.
+    """
+    options = get_vad_settings()
+    samples = pcm_samples(audio) if options['ENABLED'] else None
+    if samples is None:
+        return recognize(audio.content, recognition_config)
+
+    rate = audio.sample_rate_hertz
+    if is_silence(samples, rate, options):
+        logger.info('Extrait silencieux, appel Speech-to-Text évité')
+        return [], 'ar-MA'
+
+    segments = detect_speech_segments(samples, rate, options)
+    if not segments or sum(end - start for start, end in segments) >= options['MAX_SPEECH_RATIO'] * len(samples):
+        # VAD sans résultat ou presque tout l'extrait parlé : l'audio entier, en un appel s'il tient
+        max_length = int(options['MAX_SEGMENT_SECONDS'] * rate)
+        if len(samples) <= max_length:
+            return recognize(audio.content, recognition_config)
+        segments = [(start, min(start + max_length, len(samples))) for start in range(0, len(samples), max_length)]
+
+    segment_config = build_recognition_config(RAW_PCM_CONTENT_TYPE, rate, 1)
+    futures = [
+        get_segment_executor().submit(recognize, samples[start:end].tobytes(), segment_config)
+        for start, end in segments
+    ]
+
+    transcriptions = []
+    detected_language = 'ar-MA'
+    for (start, end), future in zip(segments, futures):
+        segment_transcriptions, segment_language = future.result()
+        if detected_language == 'ar-MA':
+            detected_language = segment_language
+        for transcription in segment_transcriptions:
+            transcription['start_time'] = round(start / rate, 2)
+            transcription['end_time'] = round(end / rate, 2)
+        transcriptions.extend(segment_transcriptions)
+    logger.info(f'{len(segments)} segments de parole reconnus ({len(samples) / rate:.1f}s d\'audio)')
+    return transcriptions, detected_language
+
+
+def is_darija_language(language_code):
+    # Normaliser le code de langue (gérer les variantes)
+    # Google peut retourner 'ar-x-maghrebi' ou d'autres variantes pour le Darija
+    normalized_language = language_code.lower() if language_code else 'ar-ma'
+    return (
+        normalized_language.startswith('ar') or
+        normalized_language == 'ar-ma' or
+        'maghrebi' in normalized_language or
+        'darija' in normalized_language
+    )
+
+
+def build_transcript_response(transcriptions, detected_language):
+    """
+    Réponse de l'API sans la traduction : meilleure transcription, langue détectée
+    et texte de recherche provisoire (texte original de tous les segments)
+    """
+    # Si aucune transcription n'a été trouvée
+    if not transcriptions:
+        return {
+            'text': '',
+            'transcriptions': [],
+            'detected_language': None,
+            'detected_language_name': None,
+            'message': 'Aucune transcription trouvée. Assurez-vous que l\'audio contient de la parole.'
+        }
+
+    # Retourner la meilleure transcription (celle avec la plus haute confiance)
+    best_transcription = max(transcriptions, key=lambda x: x.get('confidence', 0))
+
+    # Utiliser la langue détectée de la meilleure transcription si disponible
+    # Sinon, utiliser la langue principale (Darija) par défaut
+    final_detected_language = best_transcription.get('detected_language', detected_language)
+
+    return {
+        'text': best_transcription['text'],  # Texte original transcrit
+        'confidence': best_transcription.get('confidence', 0),
+        'transcriptions': transcriptions,
+        'detected_language': final_detected_language,
+        'detected_language_name': LANGUAGE_NAMES.get(final_detected_language, final_detected_language),
+        'supported_languages': SUPPORTED_LANGUAGES,
+        'search_text': ' '.join(t['text'] for t in transcriptions if t['text']),
+    }
+
+
+def add_translation(response_data, detected_language):
+    """Complète une réponse de build_transcript_response avec la traduction pour la recherche"""
+    transcriptions = response_data['transcriptions']
+    if not transcriptions:
+        return response_data
+
+    final_detected_language = response_data['detected_language']
+    is_darija = is_darija_language(final_detected_language)
+    translated_text = None
+    translation_error = None
+
+    # Traduire en français tous les segments Darija (toutes variantes), en un seul appel
+    # au cache de traductions : les segments identiques ne sont traduits qu'une fois
+    darija_segments = [
+        transcription for transcription in transcriptions
+        if transcription['text'] and is_darija_language(transcription.get('detected_language', detected_language))
+    ]
+    if darija_segments:
+        try:
+            translations = translate_texts(
+                [segment['text'] for segment in darija_segments],
+                source_language='ar',
+                target_language='fr',
+            )
+            for segment, translation in zip(darija_segments, translations):
+                segment['translated_text'] = translation
+            translated_text = ' '.join(translation for translation in translations if translation)
+            logger.info(f'Traduction Darija → Français de {len(darija_segments)} segments: "{translated_text}"')
+        except ImportError:
+            translation_error = 'Google Cloud Translation API n\'est pas installé. Installez-le avec: pip install google-cloud-translate'
+        except Exception as e:
+            # En cas d'erreur de traduction, on continue avec le texte original
+            translation_error = f'Erreur lors de la traduction: {str(e)}'
+
+    # Texte de recherche : chaque segment, traduit s'il est en Darija, dans l'ordre de l'audio
+    response_data['search_text'] = ' '.join(
+        transcription.get('translated_text') or transcription['text']
+        for transcription in transcriptions if transcription['text']
+    )
+
+    # Ajouter la traduction si disponible
+    if translated_text:
+        response_data['translated_text'] = translated_text
+        response_data['translation_status'] = 'success'  # Indicateur de succès
+    else:
+        response_data['translation_status'] = 'not_needed' if not (is_darija or darija_segments) else 'failed'
+        if translation_error:
+            response_data['translation_warning'] = translation_error
+            response_data['translation_status'] = 'error'
+            logger.error(f'Erreur de traduction: {translation_error}')
+
+    logger.info(f'Langue détectée: {final_detected_language}, Est Darija: {is_darija}')
+    logger.info(f'Texte original: "{response_data["text"]}", Texte de recherche: "{response_data["search_text"]}"')
+    return response_data
+
+
+def build_transcription_response(transcriptions, detected_language):
+    """Réponse de l'API à partir des transcriptions, avec la traduction pour la recherche"""
+    response_data = build_transcript_response(transcriptions, detected_language)
+    return add_translation(response_data, detected_language)
+
+
+# Champs de la réponse envoyés dans l'événement 'translation' du mode streaming
+TRANSLATION_FIELDS = ('transcriptions', 'translated_text', 'search_text', 'translation_status', 'translation_warning')
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Cache LRU des réponses complètes, indexé par le contenu audio et la configuration"""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                options = getattr(settings, 'TRANSCRIPTION_CACHE', {})
+                _result_cache = TTLLRUCache(
+                    max_entries=options.get('MAX_ENTRIES', 500),
+                    default_ttl=options.get('TTL', 3600),
+                )
+    return _result_cache
+
+
+def transcription_cache_key(audio_content, content_type):
+    """
+    Empreinte SHA-256 de l'audio brut, de son type MIME et des réglages qui déterminent
+    le résultat (configuration de reconnaissance, normalisation, VAD). Calculée avant
+    toute normalisation : un envoi déjà vu n'est ni décodé ni rééchantillonné.
+    """
+    recognition_config = build_recognition_config(content_type)
+    digest = hashlib.sha256(audio_content)
+    digest.update(content_type.encode('utf-8'))
+    digest.update(type(recognition_config).serialize(recognition_config))
+    digest.update(repr(sorted(get_normalization_settings().items())).encode('utf-8'))
+    digest.update(repr(sorted(get_vad_settings().items())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def transcribe_events(audio_content, content_type):
+    """
+    Transcription en étapes, sous forme de générateur de (événement, données) :
+    - 'transcript' dès le retour de la reconnaissance (texte original, langue détectée) ;
+    - 'translation' quand la traduction et le search_text définitif sont prêts ;
+    - 'result' avec la réponse complète (celle de transcribe).
+    Un envoi identique (même audio, même configuration) est servi depuis le cache.
+    Sinon, l'audio est normalisé (mono, 16 kHz, paramètres réels de l'en-tête),
+    puis découpé en segments de parole reconnus en parallèle.
+    """
+    cache = get_result_cache()
+    cache_key = transcription_cache_key(audio_content, content_type)
+    response_data = cache.get(cache_key)
+    if response_data is not None:
+        logger.info('Transcription servie depuis le cache')
+        yield 'transcript', {
+            key: value for key, value in response_data.items()
+            if key not in ('translated_text', 'translation_status', 'translation_warning')
+        }
+    else:
+        audio = prepare_audio(audio_content, content_type)
+        recognition_config = build_prepared_config(audio)
+        transcriptions, detected_language = recognize_segmented(audio, recognition_config)
+        response_data = build_transcript_response(transcriptions, detected_language)
+        # Copie des segments : add_translation les complète ensuite
+        yield 'transcript', dict(response_data, transcriptions=[dict(t) for t in transcriptions])
+
+        add_translation(response_data, detected_language)
+        # Ne pas mémoriser un résultat dont la traduction a échoué
+        if response_data.get('translation_status') != 'error':
+            cache.set(cache_key, response_data)
+
+    yield 'translation', {key: response_data[key] for key in TRANSLATION_FIELDS if key in response_data}
+    yield 'result', response_data
+
+
+def transcribe(audio_content, content_type):
+    """Transcription complète (reconnaissance + traduction) d'un contenu audio"""
+    for event, data in transcribe_events(audio_content, content_type):
+        if event == 'result':
+            return data
+
+
+def transcribe_batch(items, max_workers):
+    """
+    Transcription de plusieurs audios [(contenu, type MIME), ...] en parallèle
+    (au plus max_workers à la fois). Retourne, dans l'ordre, une liste de
+    (réponse, None) ou (None, message d'erreur) : l'échec d'un élément
+    n'interrompt pas les autres.
+    """
+    def run(item):
+        audio_content, content_type = item
+        try:
+            return transcribe(audio_content, content_type), None
+        except SpeechConfigurationError as e:
+            return None, str(e)
+        except Exception as e:
+            logger.error(f'Transcription par lot: {str(e)}')
+            return None, f'Erreur lors de la transcription: {str(e)}'
+
+    def run_in_worker(item):
+        # Threads hors du cycle de requête de Django : fermer les connexions ouvertes par les caches
+        close_old_connections()
+        try:
+            return run(item)
+        finally:
+            connections.close_all()
+
+    if len(items) <= 1 or max_workers <= 1:
+        return [run(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix='speech-batch') as executor:
+        return list(executor.map(run_in_worker, items))
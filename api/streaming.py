@@ -0,0 +1,280 @@
+"""
+Transcription en temps réel par WebSocket (servie par l'application ASGI)
+
+Protocole sur ws://<hôte>/ws/speech/stream/?content_type=audio/webm
+(pour du PCM brut audio/l16, ajouter &sample_rate=16000 : fréquence obligatoire) :
+- le client envoie l'audio en messages binaires pendant qu'il parle, puis
+  un message texte {"type": "stop"} pour terminer ;
+- le serveur répond par des messages JSON :
+  {"type": "ready"}
+  {"type": "interim", "text": ..., "stability": ...}
+  {"type": "final", "text": ..., "confidence": ..., "detected_language": ...}
+  {"type": "translation", "text": ..., "translated_text": ..., "search_text": ...}
+  {"type": "done"} ou {"type": "error", "error": ...}
+
+Les chunks sont transmis à streaming_recognize dans un thread. Quand trop
+d'audio est en attente, le serveur cesse de lire le WebSocket (backpressure) ;
+la taille totale et la durée d'une session sont bornées, et une connexion sans
+message pendant IDLE_TIMEOUT secondes est fermée (code 1008, comme les autres
+limites).
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .audio import RAW_PCM_CONTENT_TYPE, base_content_type
+from .speech import build_recognition_config, get_client, is_darija_language
+from .translation import translate_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_BUFFERED_BYTES': 512 * 1024,  # audio en attente avant de suspendre la lecture
+    'MAX_MESSAGE_BYTES': 256 * 1024,
+    'MAX_STREAM_BYTES': 10 * 1024 * 1024,
+    'MAX_DURATION': 290,  # secondes (limite Google des flux : ~5 minutes)
+    'IDLE_TIMEOUT': 30,  # secondes sans message du client avant fermeture
+    'REQUEST_CHUNK_BYTES': 16 * 1024,  # taille maximale d'une requête streaming
+}
+
+_STOP = object()
+
+
+# Code de fermeture WebSocket "policy violation" : limite dépassée ou paramètres invalides
+POLICY_VIOLATION = 1008
+
+SAMPLE_RATES = (8000, 48000)  # fréquences acceptées par Speech-to-Text (Hz)
+
+
+class StreamLimitExceeded(Exception):
+    pass
+
+
+def parse_sample_rate(query, content_type):
+    """Fréquence d'échantillonnage du paramètre sample_rate ; obligatoire pour le PCM brut"""
+    value = query.get('sample_rate', [''])[0]
+    if not value:
+        if base_content_type(content_type) == RAW_PCM_CONTENT_TYPE:
+            raise ValueError('Paramètre sample_rate requis pour le PCM brut (audio/l16).')
+        return None
+    try:
+        sample_rate = int(value)
+    except ValueError:
+        raise ValueError('Paramètre sample_rate invalide.') from None
+    if not SAMPLE_RATES[0] <= sample_rate <= SAMPLE_RATES[1]:
+        raise ValueError(f'sample_rate doit être compris entre {SAMPLE_RATES[0]} et {SAMPLE_RATES[1]} Hz.')
+    return sample_rate
+
+
+class SpeechStreamSession:
+    """Une session de reconnaissance en streaming, liée à une connexion WebSocket"""
+
+    def __init__(self, send, content_type, options, sample_rate_hertz=None):
+        self.send = send
+        self.content_type = content_type
+        self.sample_rate_hertz = sample_rate_hertz
+        self.options = options
+        self.loop = asyncio.get_running_loop()
+        self.audio_queue = queue.Queue()
+        self.events = asyncio.Queue()
+        self.buffered_bytes = 0
+        self.total_bytes = 0
+        self.started_at = time.monotonic()
+        self._buffer_lock = threading.Lock()
+        self._closed = False
+        self._recognition_done = threading.Event()
+
+    # --- Côté thread de reconnaissance ---
+
+    def _requests(self):
+        from google.cloud import speech
+
+        while True:
+            chunk = self.audio_queue.get()
+            if chunk is _STOP:
+                return
+            with self._buffer_lock:
+                self.buffered_bytes -= len(chunk)
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+    def _emit(self, event):
+        self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+
+    def _recognize(self):
+        from google.cloud import speech
+
+        try:
+            client = get_client()
+            streaming_config = speech.StreamingRecognitionConfig(
+                config=build_recognition_config(self.content_type, self.sample_rate_hertz),
+                interim_results=True,
+            )
+            for response in client.streaming_recognize(streaming_config, self._requests()):
+                for result in response.results:
+                    if not result.alternatives:
+                        continue
+                    alternative = result.alternatives[0]
+                    if result.is_final:
+                        self._emit({
+                            'type': 'final',
+                            'text': alternative.transcript,
+                            'confidence': alternative.confidence,
+                            'detected_language': result.language_code or 'ar-MA',
+                        })
+                    else:
+                        self._emit({
+                            'type': 'interim',
+                            'text': alternative.transcript,
+                            'stability': result.stability,
+                        })
+            self._emit({'type': 'done'})
+        except Exception as e:
+            logger.error(f'Streaming Speech-to-Text: {str(e)}')
+            self._emit({'type': 'error', 'error': f'Erreur lors de la transcription: {str(e)}'})
+        finally:
+            self._recognition_done.set()
+            self._emit(_STOP)
+
+    # --- Côté boucle asyncio ---
+
+    async def push_audio(self, data):
+        if len(data) > self.options['MAX_MESSAGE_BYTES']:
+            raise StreamLimitExceeded('Message audio trop volumineux.')
+        self.total_bytes += len(data)
+        if self.total_bytes > self.options['MAX_STREAM_BYTES']:
+            raise StreamLimitExceeded('Taille maximale du flux audio atteinte.')
+        if time.monotonic() - self.started_at > self.options['MAX_DURATION']:
+            raise StreamLimitExceeded('Durée maximale du flux audio atteinte.')
+
+        step = self.options['REQUEST_CHUNK_BYTES']
+        for offset in range(0, len(data), step):
+            chunk = bytes(data[offset:offset + step])
+            with self._buffer_lock:
+                self.buffered_bytes += len(chunk)
+            self.audio_queue.put(chunk)
+
+        # Backpressure : ne plus lire le WebSocket tant que Google n'a pas consommé l'audio en attente
+        while (self.buffered_bytes > self.options['MAX_BUFFERED_BYTES']
+               and not self._closed and not self._recognition_done.is_set()):
+            await asyncio.sleep(0.02)
+
+    def stop_audio(self):
+        if not self._closed:
+            self._closed = True
+            self.audio_queue.put(_STOP)
+
+    async def send_json(self, payload):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(payload, ensure_ascii=False)})
+
+    async def forward_events(self):
+        """Relaie les résultats au client, avec la traduction française de chaque segment final"""
+        while True:
+            event = await self.events.get()
+            if event is _STOP:
+                return
+            await self.send_json(event)
+            if event['type'] == 'final' and event['text'] and is_darija_language(event['detected_language']):
+                try:
+                    translated_text = await sync_to_async(translate_text)(event['text'], 'ar', 'fr')
+                    await self.send_json({
+                        'type': 'translation',
+                        'text': event['text'],
+                        'translated_text': translated_text,
+                        'search_text': translated_text,
+                    })
+                except Exception as e:
+                    await self.send_json({
+                        'type': 'translation',
+                        'text': event['text'],
+                        'search_text': event['text'],
+                        'translation_warning': f'Erreur lors de la traduction: {str(e)}',
+                    })
+
+    def receive_timeout(self):
+        """Attente maximale du prochain message : IDLE_TIMEOUT, sans dépasser MAX_DURATION"""
+        remaining = self.options['MAX_DURATION'] - (time.monotonic() - self.started_at)
+        return max(min(self.options['IDLE_TIMEOUT'], remaining), 0)
+
+    def start(self):
+        threading.Thread(target=self._recognize, name='speech-stream', daemon=True).start()
+
+
+def get_streaming_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'SPEECH_STREAMING', {}))
+    return options
+
+
+async def speech_stream_application(scope, receive, send):
+    """Application ASGI WebSocket de transcription en streaming"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    content_type = query.get('content_type', ['audio/webm'])[0]
+
+    await send({'type': 'websocket.accept'})
+    try:
+        sample_rate_hertz = parse_sample_rate(query, content_type)
+    except ValueError as e:
+        await send({'type': 'websocket.send', 'text': json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False)})
+        await send({'type': 'websocket.close', 'code': POLICY_VIOLATION})
+        return
+
+    session = SpeechStreamSession(send, content_type, get_streaming_settings(), sample_rate_hertz)
+    session.start()
+    forwarder = asyncio.ensure_future(session.forward_events())
+    await session.send_json({'type': 'ready'})
+
+    try:
+        while not forwarder.done():
+            receive_task = asyncio.ensure_future(receive())
+            done, _ = await asyncio.wait(
+                {receive_task, forwarder}, timeout=session.receive_timeout(), return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                # Client silencieux : ne pas garder indéfiniment la connexion et le flux Google
+                receive_task.cancel()
+                if time.monotonic() - session.started_at >= session.options['MAX_DURATION']:
+                    raise StreamLimitExceeded('Durée maximale du flux audio atteinte.')
+                raise StreamLimitExceeded('Aucun audio reçu, connexion fermée.')
+            if receive_task not in done:
+                receive_task.cancel()
+                break
+
+            message = receive_task.result()
+            if message['type'] == 'websocket.disconnect':
+                session.stop_audio()
+                forwarder.cancel()
+                return
+
+            if message.get('bytes') is not None:
+                await session.push_audio(message['bytes'])
+            elif message.get('text') is not None:
+                try:
+                    command = json.loads(message['text'])
+                except ValueError:
+                    command = {}
+                if command.get('type') == 'stop':
+                    session.stop_audio()
+                    break
+
+        await forwarder
+    except StreamLimitExceeded as e:
+        session.stop_audio()
+        forwarder.cancel()
+        await session.send_json({'type': 'error', 'error': str(e)})
+        await send({'type': 'websocket.close', 'code': POLICY_VIOLATION})
+        return
+    finally:
+        session.stop_audio()
+
+    await send({'type': 'websocket.close', 'code': 1000})
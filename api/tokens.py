@@ -0,0 +1,186 @@
+"""
+Service d'émission des tokens JWT
+
+Le jti et l'exp de l'access token sont lus directement dans le payload produit
+par RefreshToken, sans re-décoder le token. L'enregistrement de l'access token
+dans OutstandingToken dépend de ACCESS_TOKEN_TRACKING :
+- 'stateless' : aucune ligne par access token, la révocation passe par
+  User.tokens_valid_after (logout) et la blacklist des refresh tokens ;
+- 'write_behind' : les lignes sont mises en tampon et insérées par lots ; un lot
+  dont l'insertion échoue est remis en tête du tampon et réessayé (tampon borné à
+  MAX_PENDING tokens, les tokens expirés puis les plus anciens sont abandonnés) ;
+- 'sync' : une ligne est insérée à chaque émission (ancien comportement).
+
+Les tokens portent aussi un claim USER_CLAIMS_KEY (username, is_active, is_staff,
+updated_at) qui permet à l'authentification de construire l'utilisateur sans
+requête (JWT_LAZY_USER, voir api/authentication.py).
+"""
+import atexit
+import calendar
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import OutstandingTokenDigest
+
+logger = logging.getLogger(__name__)
+
+# Claim de l'utilisateur, recopié du refresh token dans chaque access token
+USER_CLAIMS_KEY = 'usr'
+# Époque de révocation (User.tokens_valid_after, en microsecondes) en vigueur à l'émission
+EPOCH_CLAIM = 'rev'
+
+
+def timestamp_us(value):
+    """Horodatage exact en microsecondes (comparable sans erreur d'arrondi flottant)"""
+    return calendar.timegm(value.utctimetuple()) * 1000000 + value.microsecond
+
+
+def user_claims(user):
+    return {
+        'username': user.get_username(),
+        'is_active': user.is_active,
+        'is_staff': user.is_staff,
+        'updated_at': timestamp_us(user.updated_at),
+    }
+
+
+class OutstandingTokenWriter:
+    """Tampon d'écriture différée des OutstandingToken, vidé par lots avec bulk_create"""
+
+    def __init__(self, batch_size=100, flush_interval=2.0, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='outstanding-token-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # Thread hors du cycle de requête : écarter une connexion rendue inutilisable par un échec
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(
+                    f'Écriture différée des OutstandingToken échouée, {len(self._pending)} tokens '
+                    f'en attente d\'un nouvel essai: {str(e)}'
+                )
+
+    def add(self, outstanding_token):
+        with self._lock:
+            self._pending.append(outstanding_token)
+            self._ensure_thread()
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            try:
+                self._write(batch)
+            except Exception:
+                self._requeue(batch)
+                raise
+        return len(batch)
+
+    def _write(self, batch):
+        # ignore_conflicts : un lot réessayé après un échec partiel ne crée pas de doublons
+        OutstandingToken.objects.bulk_create(batch, batch_size=self.batch_size, ignore_conflicts=True)
+        # bulk_create n'émet pas post_save : créer les empreintes ici
+        inserted = OutstandingToken.objects.filter(
+            jti__in=[outstanding_token.jti for outstanding_token in batch]
+        ).values_list('pk', 'token')
+        OutstandingTokenDigest.objects.bulk_create(
+            [OutstandingTokenDigest(token_id=pk, digest=OutstandingTokenDigest.compute(token))
+             for pk, token in inserted],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def _requeue(self, batch):
+        """Remet le lot en tête du tampon, borné à max_pending (tokens expirés puis plus anciens abandonnés)"""
+        now = timezone.now()
+        with self._lock:
+            pending = [token for token in batch + self._pending if token.expires_at > now]
+            dropped = len(batch) + len(self._pending) - len(pending)
+            if len(pending) > self.max_pending:
+                dropped += len(pending) - self.max_pending
+                pending = pending[-self.max_pending:]
+            self._pending = pending
+        if dropped:
+            logger.error(f'Écriture différée des OutstandingToken : {dropped} tokens abandonnés (expirés ou tampon plein)')
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_outstanding_token_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = OutstandingTokenWriter(
+                    batch_size=getattr(settings, 'ACCESS_TOKEN_WRITE_BEHIND_BATCH_SIZE', 100),
+                    flush_interval=getattr(settings, 'ACCESS_TOKEN_WRITE_BEHIND_INTERVAL', 2.0),
+                    max_pending=getattr(settings, 'ACCESS_TOKEN_WRITE_BEHIND_MAX_PENDING', 10000),
+                )
+    return _writer
+
+
+def track_access_token(user, access_token, encoded_access):
+    """Enregistre l'access token dans OutstandingToken selon le mode configuré"""
+    mode = getattr(settings, 'ACCESS_TOKEN_TRACKING', 'stateless')
+    if mode == 'stateless':
+        return
+
+    outstanding_token = OutstandingToken(
+        user=user,
+        jti=access_token[api_settings.JTI_CLAIM],
+        token=encoded_access,
+        created_at=access_token.current_time,
+        expires_at=datetime_from_epoch(access_token['exp']),
+    )
+    if mode == 'write_behind':
+        get_outstanding_token_writer().add(outstanding_token)
+    else:
+        outstanding_token.save()
+
+
+def issue_tokens_for_user(user):
+    """Émet une paire refresh/access pour l'utilisateur et retourne les tokens sérialisés"""
+    refresh = RefreshToken.for_user(user)
+    refresh[USER_CLAIMS_KEY] = user_claims(user)
+    refresh[EPOCH_CLAIM] = timestamp_us(user.tokens_valid_after) if user.tokens_valid_after else 0
+    access_token = refresh.access_token
+    encoded_access = str(access_token)
+
+    try:
+        track_access_token(user, access_token, encoded_access)
+    except Exception as e:
+        # Si on ne peut pas enregistrer, on continue
+        logger.warning(f'Enregistrement de l\'access token impossible: {str(e)}')
+
+    return {
+        'refresh': str(refresh),
+        'access': encoded_access,
+    }
@@ -0,0 +1,322 @@
+"""
+Cache des traductions (Darija -> Français pour la recherche)
+
+Deux niveaux : un LRU en mémoire devant une table TranslationCacheEntry.
+La clé est l'empreinte du texte source normalisé et de la paire de langues.
+Les traductions identiques demandées en même temps ne déclenchent qu'un seul
+appel à Google Translation (single-flight). translate_many traduit une liste de
+textes (dédupliqués) en une seule requête pour les entrées absentes du cache.
+"""
+import hashlib
+import html
+import logging
+import re
+import threading
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .cache import TTLLRUCache
+from .google_clients import get_translate_client
+from .models import TranslationCacheEntry
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MEMORY_MAX_ENTRIES': 5000,
+    'TTL': 30 * 24 * 3600,  # durée de vie d'une traduction (secondes)
+    'MAX_ROWS': 100000,  # taille maximale de la table
+    'EVICTION_INTERVAL': 500,  # nombre d'écritures entre deux évictions
+    'TOUCH_INTERVAL': 3600,  # délai minimal entre deux mises à jour de last_used_at
+}
+
+
+def normalize_text(text):
+    """Normalisation utilisée pour la clé de cache : Unicode NFKC, espaces réduits, minuscules"""
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TranslationCache:
+    """Cache à deux niveaux avec regroupement des appels concurrents identiques"""
+
+    def __init__(self, options=None):
+        self.options = dict(DEFAULTS)
+        self.options.update(options or {})
+        self.memory = TTLLRUCache(
+            max_entries=self.options['MEMORY_MAX_ENTRIES'],
+            default_ttl=self.options['TTL'],
+        )
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {
+            'memory_hits': 0,
+            'store_hits': 0,
+            'misses': 0,
+            'collapsed': 0,
+            'upstream_calls': 0,
+            'upstream_errors': 0,
+        }
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['memory_entries'] = len(self.memory)
+        return stats
+
+    @staticmethod
+    def make_key(text, source_language, target_language):
+        raw = f'{source_language}:{target_language}:{normalize_text(text)}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _load(self, key):
+        entry = TranslationCacheEntry.objects.filter(
+            key=key,
+            created_at__gt=timezone.now() - timedelta(seconds=self.options['TTL']),
+        ).only('translated_text', 'last_used_at').first()
+        if entry is None:
+            return None
+        if timezone.now() - entry.last_used_at > timedelta(seconds=self.options['TOUCH_INTERVAL']):
+            TranslationCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=timezone.now())
+        return entry.translated_text
+
+    def _store(self, key, text, translated_text, source_language, target_language):
+        try:
+            TranslationCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    'source_language': source_language,
+                    'target_language': target_language,
+                    'source_text': text,
+                    'translated_text': translated_text,
+                    'created_at': timezone.now(),
+                    'last_used_at': timezone.now(),
+                },
+            )
+        except IntegrityError:
+            # Écrit en parallèle par un autre processus
+            pass
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.options['EVICTION_INTERVAL'] == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Supprime les traductions expirées puis les moins récemment utilisées au-delà de MAX_ROWS"""
+        TranslationCacheEntry.objects.filter(
+            created_at__lte=timezone.now() - timedelta(seconds=self.options['TTL'])
+        ).delete()
+        overflow = TranslationCacheEntry.objects.count() - self.options['MAX_ROWS']
+        if overflow > 0:
+            pks = list(
+                TranslationCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow]
+            )
+            TranslationCacheEntry.objects.filter(pk__in=pks).delete()
+
+    def _translate_upstream(self, text, source_language, target_language):
+        self._count('upstream_calls')
+        result = get_translate_client().translate(
+            text,
+            source_language=source_language,
+            target_language=target_language,
+        )
+        # Décoder les entités HTML (comme &#39; pour ')
+        return html.unescape(result['translatedText'])
+
+    def _translate_upstream_many(self, texts, source_language, target_language):
+        self._count('upstream_calls')
+        results = get_translate_client().translate(
+            texts,
+            source_language=source_language,
+            target_language=target_language,
+        )
+        return [html.unescape(result['translatedText']) for result in results]
+
+    def translate_many(self, texts, source_language='ar', target_language='fr'):
+        """
+        Traductions d'une liste de textes, dans le même ordre. Les textes identiques
+        (après normalisation) ne sont traduits qu'une fois ; ceux absents de la
+        mémoire sont cherchés en base en une requête, puis le reste est envoyé à
+        Google en un seul appel. Les clés déjà en cours de traduction par une autre
+        requête (translate ou translate_many) ne sont pas redemandées : on attend leur résultat.
+        """
+        keys = [self.make_key(text, source_language, target_language) for text in texts]
+        found = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            translated_text = self.memory.get(key)
+            if translated_text is not None:
+                self._count('memory_hits')
+                found[key] = translated_text
+            else:
+                missing[key] = text
+
+        # Prendre en charge les clés libres, suivre celles qu'une autre requête traduit déjà
+        led = {}
+        followed = {}
+        with self._lock:
+            for key in missing:
+                flight = self._flights.get(key)
+                if flight is None:
+                    led[key] = self._flights[key] = _Flight()
+                else:
+                    followed[key] = flight
+                    self.counters['collapsed'] += 1
+        missing = {key: text for key, text in missing.items() if key in led}
+
+        try:
+            self._resolve_missing(missing, found, source_language, target_language)
+            for key, flight in led.items():
+                flight.result = found[key]
+        except Exception as e:
+            for flight in led.values():
+                flight.error = e
+            raise
+        finally:
+            with self._lock:
+                for key in led:
+                    self._flights.pop(key, None)
+            for flight in led.values():
+                flight.done.set()
+
+        for key, flight in followed.items():
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            found[key] = flight.result
+
+        return [found[key] for key in keys]
+
+    def _resolve_missing(self, missing, found, source_language, target_language):
+        """Complète found pour les clés {key: text} manquantes : une requête en base, puis un appel Google"""
+        if missing:
+            stored = TranslationCacheEntry.objects.filter(
+                key__in=list(missing),
+                created_at__gt=timezone.now() - timedelta(seconds=self.options['TTL']),
+            ).values_list('key', 'translated_text')
+            missing = dict(missing)
+            for key, translated_text in stored:
+                self._count('store_hits')
+                found[key] = translated_text
+                self.memory.set(key, translated_text)
+                del missing[key]
+
+        if missing:
+            self._count('misses', len(missing))
+            try:
+                translations = self._translate_upstream_many(list(missing.values()), source_language, target_language)
+            except Exception:
+                self._count('upstream_errors')
+                raise
+            now = timezone.now()
+            entries = []
+            for (key, text), translated_text in zip(missing.items(), translations):
+                found[key] = translated_text
+                self.memory.set(key, translated_text)
+                entries.append(TranslationCacheEntry(
+                    key=key,
+                    source_language=source_language,
+                    target_language=target_language,
+                    source_text=text,
+                    translated_text=translated_text,
+                    created_at=now,
+                    last_used_at=now,
+                ))
+            # Remplacer les éventuelles lignes expirées portant les mêmes clés
+            TranslationCacheEntry.objects.filter(key__in=list(missing)).delete()
+            TranslationCacheEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            with self._lock:
+                before = self._writes // self.options['EVICTION_INTERVAL']
+                self._writes += len(entries)
+                evict = self._writes // self.options['EVICTION_INTERVAL'] != before
+            if evict:
+                self.evict()
+
+    def translate(self, text, source_language='ar', target_language='fr'):
+        key = self.make_key(text, source_language, target_language)
+
+        translated_text = self.memory.get(key)
+        if translated_text is not None:
+            self._count('memory_hits')
+            return translated_text
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.counters['collapsed'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            translated_text = self._load(key)
+            if translated_text is not None:
+                self._count('store_hits')
+            else:
+                self._count('misses')
+                try:
+                    translated_text = self._translate_upstream(text, source_language, target_language)
+                except Exception:
+                    self._count('upstream_errors')
+                    raise
+                self._store(key, text, translated_text, source_language, target_language)
+            self.memory.set(key, translated_text)
+            flight.result = translated_text
+            return translated_text
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+
+_translation_cache = None
+_translation_cache_lock = threading.Lock()
+
+
+def get_translation_cache():
+    global _translation_cache
+    if _translation_cache is None:
+        with _translation_cache_lock:
+            if _translation_cache is None:
+                _translation_cache = TranslationCache(getattr(settings, 'TRANSLATION_CACHE', {}))
+    return _translation_cache
+
+
+def translate_text(text, source_language='ar', target_language='fr'):
+    """Traduit un texte en passant par le cache de traductions"""
+    return get_translation_cache().translate(text, source_language, target_language)
+
+
+def translate_texts(texts, source_language='ar', target_language='fr'):
+    """Traduit une liste de textes en un seul appel (entrées absentes du cache uniquement)"""
+    if not texts:
+        return []
+    return get_translation_cache().translate_many(texts, source_language, target_language)
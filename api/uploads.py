@@ -0,0 +1,205 @@
+"""
+Uploads audio reprenables (connexions mobiles instables)
+
+Protocole :
+- POST   speech/uploads/                  {"size": ..., "content_type": ...} -> upload_id
+- PATCH  speech/uploads/<id>/             en-tête Upload-Offset + octets du morceau
+- GET    speech/uploads/<id>/             offset actuel (aussi en HEAD, en-tête Upload-Offset)
+- POST   speech/uploads/<id>/finalize/    lance la transcription une fois tous les octets reçus
+- DELETE speech/uploads/<id>/             abandon
+
+Les octets sont ajoutés à un fichier local nommé d'après l'identifiant, par
+tampons de BUFFER_SIZE : ni le morceau ni le fichier ne sont chargés en mémoire.
+L'offset est la taille du fichier, donc un morceau interrompu en cours de route
+reprend exactement là où il s'est arrêté. Les uploads sans activité depuis TTL
+secondes sont expirés (plus accessibles), puis supprimés au plus tard CLEANUP_INTERVAL
+secondes après : la purge est déclenchée par les requêtes d'upload et par la boucle
+du worker de transcription.
+
+La finalisation ne supprime pas l'upload : si la transcription échoue ou si la
+réponse se perd, le client peut finaliser à nouveau sans renvoyer l'audio
+(le résultat est alors servi par le cache des transcriptions, ou la même tâche
+est renvoyée). L'upload expire TTL secondes après la dernière finalisation.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AudioUpload
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'STORAGE_DIR': '',  # par défaut : <tempdir>/kach_audio_uploads
+    'MAX_UPLOAD_BYTES': 100 * 1024 * 1024,
+    'MAX_CHUNK_BYTES': 8 * 1024 * 1024,
+    'BUFFER_SIZE': 64 * 1024,
+    'TTL': 24 * 3600,  # expiration d'un upload inactif (secondes)
+    'CLEANUP_INTERVAL': 600,
+}
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """L'offset envoyé ne correspond pas aux octets déjà reçus"""
+
+    def __init__(self, offset):
+        super().__init__(f'Offset invalide, octets déjà reçus : {offset}.')
+        self.offset = offset
+
+
+class IncompleteUpload(UploadError):
+    pass
+
+
+def get_uploads_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'SPEECH_UPLOADS', {}))
+    if not options['STORAGE_DIR']:
+        options['STORAGE_DIR'] = os.path.join(tempfile.gettempdir(), 'kach_audio_uploads')
+    return options
+
+
+def upload_path(upload, options=None):
+    options = options or get_uploads_settings()
+    return os.path.join(options['STORAGE_DIR'], f'{upload.id.hex}.part')
+
+
+def current_offset(upload):
+    try:
+        return os.path.getsize(upload_path(upload))
+    except OSError:
+        return 0
+
+
+def expires_at(upload):
+    return upload.updated_at + timedelta(seconds=get_uploads_settings()['TTL'])
+
+
+def active_uploads(options=None):
+    """Uploads non expirés (activité depuis moins de TTL secondes)"""
+    options = options or get_uploads_settings()
+    return AudioUpload.objects.filter(updated_at__gt=timezone.now() - timedelta(seconds=options['TTL']))
+
+
+def create_upload(size_bytes, content_type, user=None):
+    options = get_uploads_settings()
+    if size_bytes <= 0:
+        raise UploadError('La taille de l\'upload doit être positive.')
+    if size_bytes > options['MAX_UPLOAD_BYTES']:
+        raise UploadError(f'Le fichier audio est trop volumineux (max {options["MAX_UPLOAD_BYTES"] // (1024 * 1024)}MB).')
+
+    maybe_purge_stale_uploads(options)
+    os.makedirs(options['STORAGE_DIR'], exist_ok=True)
+    upload = AudioUpload.objects.create(
+        user=user if user is not None and user.is_authenticated else None,
+        content_type=content_type,
+        size_bytes=size_bytes,
+    )
+    open(upload_path(upload, options), 'wb').close()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Ajoute `length` octets lus dans `stream` à partir de `offset`. Retourne le
+    nouvel offset (plus petit que prévu si le client s'est déconnecté en route).
+    """
+    options = get_uploads_settings()
+    if length > options['MAX_CHUNK_BYTES']:
+        raise UploadError(f'Morceau trop volumineux (max {options["MAX_CHUNK_BYTES"] // (1024 * 1024)}MB).')
+
+    path = upload_path(upload, options)
+    if not os.path.exists(path):
+        raise UploadError('Upload expiré ou introuvable.')
+
+    with open(path, 'ab') as f:
+        if fcntl is not None:
+            # Deux PATCH simultanés sur le même upload : le second attend puis voit le bon offset
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        received = f.seek(0, os.SEEK_END)
+        if offset != received:
+            raise OffsetMismatch(received)
+        if received + length > upload.size_bytes:
+            raise UploadError('Le morceau dépasse la taille annoncée de l\'upload.')
+
+        remaining = length
+        while remaining > 0:
+            data = stream.read(min(options['BUFFER_SIZE'], remaining)) if stream is not None else b''
+            if not data:
+                break
+            f.write(data)
+            remaining -= len(data)
+        f.flush()
+        received = f.tell()
+
+    AudioUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return received
+
+
+def completed_upload_path(upload):
+    """
+    Vérifie que tous les octets sont reçus et retourne le chemin du fichier.
+    L'upload est conservé (et son expiration repoussée) pour permettre de finaliser à nouveau.
+    """
+    received = current_offset(upload)
+    if received != upload.size_bytes:
+        raise IncompleteUpload(f'Upload incomplet : {received} octets reçus sur {upload.size_bytes}.')
+    AudioUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return upload_path(upload)
+
+
+def discard_upload(upload):
+    remove_file(upload_path(upload))
+    upload.delete()
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def purge_stale_uploads(ttl):
+    """Supprime les uploads sans activité depuis plus de ttl secondes"""
+    options = get_uploads_settings()
+    stale = AudioUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=ttl))
+    stale_ids = list(stale.values_list('pk', flat=True))
+    for upload_id in stale_ids:
+        remove_file(os.path.join(options['STORAGE_DIR'], f'{upload_id.hex}.part'))
+    AudioUpload.objects.filter(pk__in=stale_ids).delete()
+    return len(stale_ids)
+
+
+_last_cleanup = 0
+_cleanup_lock = threading.Lock()
+
+
+def maybe_purge_stale_uploads(options):
+    """Purge au plus une fois par CLEANUP_INTERVAL (requêtes d'upload, boucle du worker de transcription)"""
+    global _last_cleanup
+    with _cleanup_lock:
+        if time.monotonic() - _last_cleanup < options['CLEANUP_INTERVAL'] and _last_cleanup:
+            return
+        _last_cleanup = time.monotonic()
+    try:
+        purged = purge_stale_uploads(options['TTL'])
+        if purged:
+            logger.info(f'{purged} uploads audio expirés supprimés')
+    except Exception as e:
+        logger.error(f'Purge des uploads audio échouée: {str(e)}')
@@ -1,14 +1,16 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     # Authentification
     path('auth/register/', views.register_user, name='register'),
     path('auth/login/', views.login_user, name='login'),
     path('auth/google/', views.google_oauth, name='google_oauth'),
+    path('auth/google/async/', async_views.google_oauth_async, name='google_oauth_async'),
     path('auth/logout/', views.logout_user, name='logout'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/introspect/', views.introspect_tokens_view, name='introspect_tokens'),
     
     # Profil utilisateur
     path('user/profile/', views.get_user_profile, name='user_profile'),
@@ -18,7 +20,17 @@ urlpatterns = [
     # Health check
     path('health/', views.health_check, name='health_check'),
     
+    # Services internes (en-tête X-Internal-Token)
+    path('internal/stats/', views.internal_stats, name='internal_stats'),
+    
     # Speech-to-Text
     path('speech/transcribe/', views.transcribe_audio, name='transcribe_audio'),
+    path('speech/transcribe/batch/', views.transcribe_audio_batch, name='transcribe_audio_batch'),
+    path('speech/transcribe/async/', async_views.transcribe_audio_async, name='transcribe_audio_async'),
+    path('speech/uploads/', views.create_audio_upload, name='create_audio_upload'),
+    path('speech/uploads/<uuid:upload_id>/', views.audio_upload, name='audio_upload'),
+    path('speech/uploads/<uuid:upload_id>/finalize/', views.finalize_audio_upload, name='finalize_audio_upload'),
+    path('speech/jobs/', views.create_transcription_job, name='create_transcription_job'),
+    path('speech/jobs/<uuid:job_id>/', views.get_transcription_job, name='transcription_job'),
 ]
 
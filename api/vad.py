@@ -0,0 +1,120 @@
+"""
+Détection d'activité vocale (VAD) par énergie sur le PCM normalisé
+
+Le signal est découpé en trames de FRAME_MS ; l'énergie RMS de toutes les trames
+est calculée en une seule opération NumPy. Une trame est considérée comme de la
+parole si son énergie dépasse le bruit de fond estimé (percentile bas) de
+MARGIN_DB, et au moins ABSOLUTE_THRESHOLD_DB. Le seuil relatif est plafonné à
+MAX_RELATIVE_THRESHOLD_DB et ignoré si les énergies varient de moins de MARGIN_DB :
+un extrait parlé d'un bout à l'autre n'a pas de silence, son percentile bas est
+le niveau de la parole. Les pauses courtes sont comblées, les segments trop courts
+ignorés, et les segments trop longs pour un appel `recognize` synchrone (~1 minute)
+redécoupés.
+"""
+import numpy as np
+from django.conf import settings
+
+from .audio import RAW_PCM_CONTENT_TYPE, WAV_CONTENT_TYPES, base_content_type, parse_wav_header
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FRAME_MS': 30,
+    'MARGIN_DB': 10.0,  # au-dessus du bruit de fond
+    'ABSOLUTE_THRESHOLD_DB': -50.0,  # dBFS minimal pour de la parole
+    'MAX_RELATIVE_THRESHOLD_DB': -35.0,  # plafond du seuil relatif au bruit de fond
+    'MAX_SPEECH_RATIO': 0.9,  # au-delà, l'extrait entier est reconnu en un appel
+    'NOISE_PERCENTILE': 10,
+    'MIN_SPEECH_MS': 200,  # segments plus courts ignorés
+    'MIN_SILENCE_MS': 600,  # pauses plus courtes comblées
+    'PADDING_MS': 200,  # marge conservée autour de chaque segment
+    'MAX_SEGMENT_SECONDS': 55,  # limite de recognize (1 minute)
+    'MAX_WORKERS': 4,  # segments reconnus en parallèle (pool partagé par le processus)
+}
+
+
+def get_vad_settings():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'VOICE_ACTIVITY', {}))
+    return options
+
+
+def pcm_samples(audio):
+    """Échantillons int16 mono d'un PreparedAudio, ou None si l'audio n'est pas du PCM décodable"""
+    if audio.channels != 1 or not audio.sample_rate_hertz:
+        return None
+    if audio.content_type == RAW_PCM_CONTENT_TYPE:
+        return np.frombuffer(audio.content, dtype='<i2', count=len(audio.content) // 2)
+    if base_content_type(audio.content_type) in WAV_CONTENT_TYPES:
+        fmt = parse_wav_header(audio.content)
+        if fmt['format_tag'] != 1 or fmt['bits_per_sample'] != 16:
+            return None
+        return np.frombuffer(audio.content, dtype='<i2', count=fmt['data_size'] // 2, offset=fmt['data_offset'])
+    return None
+
+
+def frame_energies_db(samples, frame_length):
+    """Énergie RMS (dBFS) de chaque trame complète"""
+    n_frames = len(samples) // frame_length
+    frames = samples[:n_frames * frame_length].reshape(n_frames, frame_length).astype(np.float32) / 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def runs(mask):
+    """(début, fin) des suites de True dans un tableau booléen, fin exclue"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def is_silence(samples, sample_rate, options=None):
+    """Vrai si aucune trame n'atteint ABSOLUTE_THRESHOLD_DB (rien à envoyer à Speech-to-Text)"""
+    options = options or get_vad_settings()
+    frame_length = max(int(sample_rate * options['FRAME_MS'] / 1000), 1)
+    if len(samples) < frame_length:
+        return not np.any(samples)
+    return bool(np.max(frame_energies_db(samples, frame_length)) <= options['ABSOLUTE_THRESHOLD_DB'])
+
+
+def speech_threshold_db(energies, options):
+    """Seuil de parole : bruit de fond + MARGIN_DB, plafonné, jamais sous le seuil absolu"""
+    noise_floor, peak = np.percentile(energies, [options['NOISE_PERCENTILE'], 100 - options['NOISE_PERCENTILE']])
+    if peak - noise_floor < options['MARGIN_DB']:
+        # Pas de contraste entre bruit et parole : pas de silence dans l'extrait
+        return options['ABSOLUTE_THRESHOLD_DB']
+    relative = min(noise_floor + options['MARGIN_DB'], options['MAX_RELATIVE_THRESHOLD_DB'])
+    return max(relative, options['ABSOLUTE_THRESHOLD_DB'])
+
+
+def detect_speech_segments(samples, sample_rate, options=None):
+    """Segments de parole (échantillon de début, échantillon de fin), dans l'ordre"""
+    options = options or get_vad_settings()
+    frame_length = max(int(sample_rate * options['FRAME_MS'] / 1000), 1)
+    if len(samples) < frame_length:
+        return []
+
+    energies = frame_energies_db(samples, frame_length)
+    speech = energies > speech_threshold_db(energies, options)
+
+    # Combler les pauses courtes entre deux passages de parole
+    min_silence = int(np.ceil(options['MIN_SILENCE_MS'] / options['FRAME_MS']))
+    starts, ends = runs(~speech)
+    for start, end in zip(starts, ends):
+        if 0 < start and end < len(speech) and end - start < min_silence:
+            speech[start:end] = True
+
+    min_speech = int(np.ceil(options['MIN_SPEECH_MS'] / options['FRAME_MS']))
+    padding = int(options['PADDING_MS'] * sample_rate / 1000)
+    max_length = int(options['MAX_SEGMENT_SECONDS'] * sample_rate)
+
+    segments = []
+    starts, ends = runs(speech)
+    for start, end in zip(starts, ends):
+        if end - start < min_speech:
+            continue
+        first = max(start * frame_length - padding, 0)
+        last = min(end * frame_length + padding, len(samples))
+        # Redécouper en parts égales ce qui dépasse la limite de recognize
+        pieces = int(np.ceil((last - first) / max_length))
+        bounds = np.linspace(first, last, pieces + 1).astype(int)
+        segments.extend(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+    return segments
@@ -1,19 +1,35 @@
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
 from django.contrib.auth import get_user_model
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
-import jwt
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 import requests
 from django.conf import settings
 from .serializers import UserSerializer, RegisterSerializer, LoginSerializer, UpdateProfileSerializer, ChangePasswordSerializer
+from .tokens import issue_tokens_for_user
+from .revocation import get_revocation_cache
+from .authentication import introspect_tokens
+from .permissions import IsInternalService
+from .http_client import get_http_client
+from .translation import get_translation_cache
+from .accounts import upsert_google_user
+from .google_auth import verify_google_id_token, fetch_google_userinfo, GoogleTokenError
+from .speech import transcribe, transcribe_events, transcribe_batch, SpeechConfigurationError
+from .jobs import (
+    enqueue_transcription, enqueue_transcription_file, ensure_long_audio_supported, get_jobs_settings,
+    get_transcription_worker, JobQueueFull, UnsupportedLongAudio,
+)
+from .models import TranscriptionJob
+from .audio import mapped_file, uploaded_audio_buffer
+from . import uploads
 import io
-import os
-from decouple import config
+import json
+from contextlib import ExitStack
 
 User = get_user_model()
 
@@ -23,24 +39,55 @@ def home(request):
     return render(request, 'api/home.html')
 
 
+def profile_validators(user):
+    """ETag et date de dernière modification (timestamp) du profil, dérivés de updated_at"""
+    return quote_etag(f'{user.pk}-{user.updated_at.timestamp():.6f}'), int(user.updated_at.timestamp())
+
+
+def with_profile_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Données personnelles : pas de cache partagé, revalidation à chaque lecture
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_user_profile(request):
-    """Récupérer le profil de l'utilisateur connecté"""
-    serializer = UserSerializer(request.user, context={'request': request})
-    return Response(serializer.data)
+    """
+    Récupérer le profil de l'utilisateur connecté
+    ETag / Last-Modified dérivés de updated_at : 304 sans sérialisation si le profil n'a pas changé.
+    """
+    etag, last_modified = profile_validators(request.user)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        serializer = UserSerializer(request.user, context={'request': request})
+        response = Response(serializer.data)
+    return with_profile_validators(response, etag, last_modified)
 
 
 @api_view(['PATCH', 'PUT'])
 @permission_classes([permissions.IsAuthenticated])
 def update_user_profile(request):
-    """Mettre à jour le profil de l'utilisateur connecté"""
+    """
+    Mettre à jour le profil de l'utilisateur connecté
+    If-Match (ETag de get_user_profile) : 412 si le profil a été modifié entre-temps.
+    """
+    etag, last_modified = profile_validators(request.user)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return with_profile_validators(response, etag, last_modified)
+
     serializer = UpdateProfileSerializer(request.user, data=request.data, partial=True)
     if serializer.is_valid():
-        serializer.save()
+        user = serializer.save()
+        if not serializer.changed_fields:
+            # Rien n'a changé : pas d'écriture ni de nouvelle sérialisation
+            return with_profile_validators(Response(status=status.HTTP_204_NO_CONTENT), etag, last_modified)
         # Retourner les données complètes
-        user_serializer = UserSerializer(request.user, context={'request': request})
-        return Response(user_serializer.data, status=status.HTTP_200_OK)
+        user_serializer = UserSerializer(user, context={'request': request})
+        return with_profile_validators(Response(user_serializer.data, status=status.HTTP_200_OK), *profile_validators(user))
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -50,8 +97,12 @@ def change_password(request):
     """Changer le mot de passe de l'utilisateur connecté"""
     serializer = ChangePasswordSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
-        serializer.save()
-        return Response({'message': 'Le mot de passe a été modifié avec succès.'}, status=status.HTTP_200_OK)
+        user = serializer.save()
+        # Les tokens existants sont révoqués : en émettre de nouveaux pour cette session
+        return Response({
+            'message': 'Le mot de passe a été modifié avec succès.',
+            'tokens': issue_tokens_for_user(user),
+        }, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -62,32 +113,12 @@ def register_user(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        refresh = RefreshToken.for_user(user)
-        access_token = refresh.access_token
-        
-        # Enregistrer l'access token dans OutstandingToken pour pouvoir le blacklister
-        try:
-            decoded_access = jwt.decode(str(access_token), settings.SECRET_KEY, algorithms=['HS256'])
-            jti_access = decoded_access.get('jti')
-            if jti_access:
-                OutstandingToken.objects.get_or_create(
-                    jti=jti_access,
-                    defaults={
-                        'user': user,
-                        'token': str(access_token),
-                        'created_at': timezone.now(),
-                        'expires_at': timezone.now() + timedelta(hours=1),
-                    }
-                )
-        except Exception:
-            pass  # Si on ne peut pas enregistrer, on continue
+        # Générer les tokens JWT (jti/exp lus dans le payload, sans re-décodage)
+        tokens = issue_tokens_for_user(user)
         
         return Response({
             'user': UserSerializer(user, context={'request': request}).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(access_token),
-            }
+            'tokens': tokens,
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -99,32 +130,12 @@ def login_user(request):
     serializer = LoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
-        access_token = refresh.access_token
-        
-        # Enregistrer l'access token dans OutstandingToken pour pouvoir le blacklister
-        try:
-            decoded_access = jwt.decode(str(access_token), settings.SECRET_KEY, algorithms=['HS256'])
-            jti_access = decoded_access.get('jti')
-            if jti_access:
-                OutstandingToken.objects.get_or_create(
-                    jti=jti_access,
-                    defaults={
-                        'user': user,
-                        'token': str(access_token),
-                        'created_at': timezone.now(),
-                        'expires_at': timezone.now() + timedelta(hours=1),
-                    }
-                )
-        except Exception:
-            pass  # Si on ne peut pas enregistrer, on continue
+        # Générer les tokens JWT (jti/exp lus dans le payload, sans re-décodage)
+        tokens = issue_tokens_for_user(user)
         
         return Response({
             'user': UserSerializer(user, context={'request': request}).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(access_token),
-            }
+            'tokens': tokens,
         }, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -132,48 +143,56 @@ def login_user(request):
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def logout_user(request):
-    """Déconnexion d'un utilisateur (blacklist du refresh token et access token)"""
+    """Déconnexion d'un utilisateur (révocation de tous ses tokens)"""
     try:
         refresh_token = request.data.get('refresh_token')
         if not refresh_token:
             return Response({'error': 'Refresh token requis.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Blacklister le refresh token
-        token = RefreshToken(refresh_token)
-        token.blacklist()
+        # Blacklister le refresh token fourni : il ne pourra plus être rafraîchi
+        RefreshToken(refresh_token).blacklist()
         
-        # Blacklister aussi l'access token actuel depuis le header Authorization
-        try:
-            # Récupérer le jti de l'access token actuel
-            auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-            if auth_header.startswith('Bearer '):
-                access_token_str = auth_header.split(' ')[1]
-                decoded_access = jwt.decode(access_token_str, settings.SECRET_KEY, algorithms=['HS256'])
-                jti_access = decoded_access.get('jti')
-                
-                if jti_access:
-                    outstanding_token = OutstandingToken.objects.filter(jti=jti_access).first()
-                    if outstanding_token:
-                        BlacklistedToken.objects.get_or_create(token=outstanding_token)
-        except Exception:
-            pass
-        
-        # Blacklister aussi tous les autres tokens outstanding de cet utilisateur
-        try:
-            user = request.user
-            outstanding_tokens = OutstandingToken.objects.filter(user=user)
-            
-            for outstanding_token in outstanding_tokens:
-                if not BlacklistedToken.objects.filter(token=outstanding_token).exists():
-                    BlacklistedToken.objects.get_or_create(token=outstanding_token)
-        except Exception:
-            pass
+        # Révoquer tous les autres tokens de l'utilisateur en une seule requête :
+        # l'authentification refuse les tokens émis avant tokens_valid_after (claim rev).
+        User.objects.filter(pk=request.user.pk).update(tokens_valid_after=timezone.now())
+        # update() n'émet pas post_save : invalider l'état de révocation en cache ici
+        get_revocation_cache().invalidate_user(request.user.pk)
         
         return Response({'message': 'Déconnexion réussie. Tous les tokens ont été invalidés.'}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': f'Token invalide: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([IsInternalService])
+def introspect_tokens_view(request):
+    """
+    Introspection par lot pour les services internes : {"tokens": [...]} ->
+    {"results": [{"active": ..., "claims"|"error": ...}, ...]} dans le même ordre
+    """
+    raw_tokens = request.data.get('tokens')
+    if not isinstance(raw_tokens, list) or not raw_tokens:
+        return Response({'error': 'Liste "tokens" requise.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_tokens = getattr(settings, 'INTERNAL_INTROSPECTION_MAX_TOKENS', 100)
+    if len(raw_tokens) > max_tokens:
+        return Response({'error': f'Trop de tokens (max {max_tokens}).'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({'results': introspect_tokens(raw_tokens)}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([IsInternalService])
+def internal_stats(request):
+    """Statistiques du processus pour les services internes (supervision)"""
+    return Response({
+        'http_client': get_http_client().stats(),
+        'translation_cache': get_translation_cache().stats(),
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def health_check(request):
@@ -198,15 +217,12 @@ def google_oauth(request):
         
         # Si on a un credential (JWT), on doit d'abord obtenir un access_token
         if credential:
-            # Vérifier le credential JWT avec Google
-            google_token_info_url = 'https://oauth2.googleapis.com/tokeninfo'
-            params = {'id_token': credential}
-            token_response = requests.get(google_token_info_url, params=params)
-            
-            if token_response.status_code != 200:
+            # Vérifier le credential JWT localement avec les certificats Google en cache
+            try:
+                token_data = verify_google_id_token(credential)
+            except GoogleTokenError:
                 return Response({'error': 'Credential Google invalide.'}, status=status.HTTP_401_UNAUTHORIZED)
             
-            token_data = token_response.json()
             # Utiliser le sub (subject) comme google_id
             google_id = token_data.get('sub')
             email = token_data.get('email')
@@ -217,87 +233,31 @@ def google_oauth(request):
             if not google_id or not email:
                 return Response({'error': 'Informations Google incomplètes.'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Chercher ou créer l'utilisateur
-            user = None
-            try:
-                user = User.objects.get(google_id=google_id)
-                # Mettre à jour l'avatar si l'utilisateur existe déjà
-                if picture and user.avatar_url != picture:
-                    user.avatar_url = picture
-                    user.save()
-            except User.DoesNotExist:
-                try:
-                    user = User.objects.get(email=email)
-                    if user and not user.google_id:
-                        user.google_id = google_id
-                        # Mettre à jour l'avatar si disponible
-                        if picture:
-                            user.avatar_url = picture
-                        user.save()
-                except User.DoesNotExist:
-                    username = email.split('@')[0]
-                    base_username = username
-                    counter = 1
-                    while User.objects.filter(username=username).exists():
-                        username = f"{base_username}{counter}"
-                        counter += 1
-                    
-                    user = User.objects.create_user(
-                        username=username,
-                        email=email,
-                        first_name=first_name,
-                        last_name=last_name,
-                        google_id=google_id,
-                        avatar_url=picture,  # Sauvegarder l'image de profil Google
-                        is_active=True
-                    )
+            # Chercher (google_id ou email) ou créer l'utilisateur
+            user = upsert_google_user(google_id, email, first_name, last_name, picture)
             
             if not user:
                 return Response({'error': 'Erreur lors de la création/récupération de l\'utilisateur.'}, 
                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
-            # Générer les tokens JWT
-            refresh = RefreshToken.for_user(user)
-            access_token_jwt = refresh.access_token
-            
-            # Enregistrer l'access token dans OutstandingToken
-            try:
-                decoded_access = jwt.decode(str(access_token_jwt), settings.SECRET_KEY, algorithms=['HS256'])
-                jti_access = decoded_access.get('jti')
-                if jti_access:
-                    OutstandingToken.objects.get_or_create(
-                        jti=jti_access,
-                        defaults={
-                            'user': user,
-                            'token': str(access_token_jwt),
-                            'created_at': timezone.now(),
-                            'expires_at': timezone.now() + timedelta(hours=1),
-                        }
-                    )
-            except Exception:
-                pass
+            # Générer les tokens JWT (jti/exp lus dans le payload, sans re-décodage)
+            tokens = issue_tokens_for_user(user)
             
             return Response({
                 'user': UserSerializer(user, context={'request': request}).data,
-                'tokens': {
-                    'refresh': str(refresh),
-                    'access': str(access_token_jwt),
-                }
+                'tokens': tokens,
             }, status=status.HTTP_200_OK)
         
         # Si on a un access_token (ancienne méthode)
         if not access_token:
             return Response({'error': 'Token Google requis.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Vérifier le token avec Google
-        google_user_info_url = 'https://www.googleapis.com/oauth2/v2/userinfo'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        response = requests.get(google_user_info_url, headers=headers)
-        
-        if response.status_code != 200:
+        # Vérifier le token avec Google (réponse userinfo mise en cache brièvement)
+        try:
+            google_data = fetch_google_userinfo(access_token)
+        except GoogleTokenError:
             return Response({'error': 'Token Google invalide.'}, status=status.HTTP_401_UNAUTHORIZED)
         
-        google_data = response.json()
         google_id = google_data.get('id')
         email = google_data.get('email')
         first_name = google_data.get('given_name', '')
@@ -307,75 +267,19 @@ def google_oauth(request):
         if not google_id or not email:
             return Response({'error': 'Informations Google incomplètes.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Chercher l'utilisateur par google_id ou email
-        user = None
-        try:
-            user = User.objects.get(google_id=google_id)
-            # Mettre à jour l'avatar si l'utilisateur existe déjà
-            if picture and user.avatar_url != picture:
-                user.avatar_url = picture
-                user.save()
-        except User.DoesNotExist:
-            try:
-                user = User.objects.get(email=email)
-                # Si l'utilisateur existe mais n'a pas de google_id, l'ajouter
-                if user and not user.google_id:
-                    user.google_id = google_id
-                    # Mettre à jour l'avatar si disponible
-                    if picture:
-                        user.avatar_url = picture
-                    user.save()
-            except User.DoesNotExist:
-                # Créer un nouvel utilisateur
-                username = email.split('@')[0]
-                # S'assurer que le username est unique
-                base_username = username
-                counter = 1
-                while User.objects.filter(username=username).exists():
-                    username = f"{base_username}{counter}"
-                    counter += 1
-                
-                user = User.objects.create_user(
-                    username=username,
-                    email=email,
-                    first_name=first_name,
-                    last_name=last_name,
-                    google_id=google_id,
-                    avatar_url=picture,  # Sauvegarder l'image de profil Google
-                    is_active=True
-                )
+        # Chercher (google_id ou email) ou créer l'utilisateur
+        user = upsert_google_user(google_id, email, first_name, last_name, picture)
         
         if not user:
             return Response({'error': 'Erreur lors de la création/récupération de l\'utilisateur.'}, 
                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Générer les tokens JWT
-        refresh = RefreshToken.for_user(user)
-        access_token_jwt = refresh.access_token
-        
-        # Enregistrer l'access token dans OutstandingToken pour pouvoir le blacklister
-        try:
-            decoded_access = jwt.decode(str(access_token_jwt), settings.SECRET_KEY, algorithms=['HS256'])
-            jti_access = decoded_access.get('jti')
-            if jti_access:
-                OutstandingToken.objects.get_or_create(
-                    jti=jti_access,
-                    defaults={
-                        'user': user,
-                        'token': str(access_token_jwt),
-                        'created_at': timezone.now(),
-                        'expires_at': timezone.now() + timedelta(hours=1),
-                    }
-                )
-        except Exception:
-            pass  # Si on ne peut pas enregistrer, on continue
+        # Générer les tokens JWT (jti/exp lus dans le payload, sans re-décodage)
+        tokens = issue_tokens_for_user(user)
         
         return Response({
             'user': UserSerializer(user, context={'request': request}).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(access_token_jwt),
-            }
+            'tokens': tokens,
         }, status=status.HTTP_200_OK)
         
     except requests.RequestException as e:
@@ -386,6 +290,32 @@ def google_oauth(request):
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def server_sent_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def transcription_event_stream(audio_file, content_type):
+    """
+    Événements SSE de transcription : 'transcript' (texte original et langue) dès la
+    reconnaissance, puis 'translation' (traduction et search_text), puis 'done'
+    """
+    # Commentaire initial : les en-têtes partent avant la reconnaissance
+    yield ': transcription en cours\n\n'
+    try:
+        with uploaded_audio_buffer(audio_file) as audio_content:
+            for event, data in transcribe_events(audio_content, content_type):
+                if event == 'result':
+                    break
+                yield server_sent_event(event, data)
+    except SpeechConfigurationError as e:
+        yield server_sent_event('error', {'error': str(e)})
+        return
+    except Exception as e:
+        yield server_sent_event('error', {'error': f'Erreur lors de la transcription: {str(e)}'})
+        return
+    yield server_sent_event('done', {})
+
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])  # Vous pouvez changer en IsAuthenticated si nécessaire
 def transcribe_audio(request):
@@ -407,258 +337,32 @@ def transcribe_audio(request):
         
         # Importer Google Cloud Speech (avec gestion d'erreur si non configuré)
         try:
-            from google.cloud import speech
+            from google.cloud import speech  # noqa: F401
         except ImportError:
             return Response({
                 'error': 'Google Cloud Speech-to-Text n\'est pas installé. Installez-le avec: pip install google-cloud-speech'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Configuration des credentials Google Cloud
-        # Option 1: Variable d'environnement GOOGLE_APPLICATION_CREDENTIALS
-        # Option 2: Chemin vers le fichier JSON dans les settings
-        credentials_path = config('GOOGLE_APPLICATION_CREDENTIALS', default='')
-        
-        # Si un chemin est fourni dans les settings, l'utiliser
-        if not credentials_path and hasattr(settings, 'GOOGLE_APPLICATION_CREDENTIALS'):
-            credentials_path = settings.GOOGLE_APPLICATION_CREDENTIALS
-        
-        # Initialiser le client Speech-to-Text
-        if credentials_path and os.path.exists(credentials_path):
-            client = speech.SpeechClient.from_service_account_json(credentials_path)
-        else:
-            # Essayer d'utiliser les credentials par défaut (variable d'environnement ou Application Default Credentials)
-            try:
-                client = speech.SpeechClient()
-            except Exception as e:
-                return Response({
-                    'error': f'Erreur de configuration Google Cloud: {str(e)}. '
-                            'Assurez-vous que GOOGLE_APPLICATION_CREDENTIALS est configuré ou que '
-                            'les Application Default Credentials sont configurées.'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # Lire le contenu du fichier audio
-        audio_content = audio_file.read()
-        
         # Détecter le type MIME du fichier
         content_type = audio_file.content_type or 'audio/webm'
         
-        # Mapper les types MIME aux encodings Google Cloud Speech
-        encoding_map = {
-            'audio/webm': speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-            'audio/webm;codecs=opus': speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-            'audio/ogg': speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
-            'audio/ogg;codecs=opus': speech.RecognitionConfig.AudioEncoding.OGG_OPUS,
-            'audio/wav': speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            'audio/x-wav': speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            'audio/mp3': speech.RecognitionConfig.AudioEncoding.MP3,
-            'audio/mpeg': speech.RecognitionConfig.AudioEncoding.MP3,
-            'audio/flac': speech.RecognitionConfig.AudioEncoding.FLAC,
-        }
-        
-        # Utiliser WEBM_OPUS par défaut (format le plus courant pour MediaRecorder)
-        audio_encoding = encoding_map.get(content_type, speech.RecognitionConfig.AudioEncoding.WEBM_OPUS)
-        
-        # Configuration de la reconnaissance vocale multilingue
-        # Priorité: 1. Darija (ar-MA), 2. Français (fr-FR), 3. Anglais (en-US)
-        # Pour WEBM_OPUS et OGG_OPUS, on peut omettre sample_rate_hertz pour la détection automatique
-        config_params = {
-            'encoding': audio_encoding,
-            'language_code': 'ar-MA',  # Langue principale: Darija (arabe marocain)
-            'alternative_language_codes': ['fr-FR', 'en-US'],  # Langues secondaires: Français et Anglais
-            'enable_automatic_punctuation': True,
-            'enable_word_confidence': True,
-            'model': 'latest_long',  # Utilise le meilleur modèle pour les enregistrements longs
-            # Alternative: 'phone_call' pour les conversations téléphoniques
-            # 'model': 'phone_call',
-        }
-        
-        # Ajouter sample_rate_hertz seulement pour les formats qui le nécessitent
-        # Pour WEBM_OPUS et OGG_OPUS, Google Cloud peut détecter automatiquement
-        if audio_encoding not in [
-            speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-            speech.RecognitionConfig.AudioEncoding.OGG_OPUS
-        ]:
-            # Pour les autres formats, utiliser un sample rate standard
-            config_params['sample_rate_hertz'] = 44100
-        
-        config_speech = speech.RecognitionConfig(**config_params)
-        
-        # Créer l'objet audio
-        audio = speech.RecognitionAudio(content=audio_content)
-        
-        # Effectuer la transcription
-        response = client.recognize(config=config_speech, audio=audio)
-        
-        # Extraire le texte transcrit avec détection de langue
-        transcriptions = []
-        detected_language = 'ar-MA'  # Par défaut: Darija (langue principale)
-        
-        for result in response.results:
-            alternative = result.alternatives[0]
-            transcription_data = {
-                'text': alternative.transcript,
-                'confidence': alternative.confidence,
-            }
-            
-            # Essayer de détecter la langue depuis les résultats
-            # Note: Avec alternative_language_codes, Google Cloud peut retourner 
-            # la langue détectée dans language_code si disponible
-            if hasattr(result, 'language_code') and result.language_code:
-                transcription_data['detected_language'] = result.language_code
-                # Utiliser la première langue détectée trouvée
-                if detected_language == 'ar-MA':  # Si on n'a pas encore de langue détectée
-                    detected_language = result.language_code
-            
-            transcriptions.append(transcription_data)
-        
-        # Si aucune transcription n'a été trouvée
-        if not transcriptions:
-            return Response({
-                'text': '',
-                'transcriptions': [],
-                'detected_language': None,
-                'detected_language_name': None,
-                'message': 'Aucune transcription trouvée. Assurez-vous que l\'audio contient de la parole.'
-            }, status=status.HTTP_200_OK)
-        
-        # Retourner la meilleure transcription (celle avec la plus haute confiance)
-        best_transcription = max(transcriptions, key=lambda x: x.get('confidence', 0))
-        
-        # Utiliser la langue détectée de la meilleure transcription si disponible
-        # Sinon, utiliser la langue principale (Darija) par défaut
-        final_detected_language = best_transcription.get('detected_language', detected_language)
-        
-        # Normaliser le code de langue (gérer les variantes)
-        # Google peut retourner 'ar-x-maghrebi' ou d'autres variantes pour le Darija
-        normalized_language = final_detected_language.lower() if final_detected_language else 'ar-ma'
-        is_darija = (
-            normalized_language.startswith('ar') or 
-            normalized_language == 'ar-ma' or 
-            'maghrebi' in normalized_language or
-            'darija' in normalized_language
-        )
-        
-        # Mapper les codes de langue pour l'affichage
-        language_names = {
-            'ar-MA': 'Darija (Arabe Marocain)',
-            'ar': 'Darija (Arabe Marocain)',
-            'ar-x-maghrebi': 'Darija (Arabe Marocain)',
-            'fr-FR': 'Français',
-            'fr': 'Français',
-            'en-US': 'Anglais',
-            'en': 'Anglais',
-        }
-        
-        # Traduire le texte Darija en français pour la recherche
-        original_text = best_transcription['text']
-        translated_text = None
-        translation_error = None
-        
-        # Si la langue détectée est Darija (toutes variantes), traduire en français
-        if is_darija:
-            try:
-                from google.cloud import translate_v2 as translate
-                from google.oauth2 import service_account
-                
-                # Utiliser les mêmes credentials que Speech-to-Text
-                credentials_path = config('GOOGLE_APPLICATION_CREDENTIALS', default='')
-                if not credentials_path and hasattr(settings, 'GOOGLE_APPLICATION_CREDENTIALS'):
-                    credentials_path = settings.GOOGLE_APPLICATION_CREDENTIALS
-                
-                # Si le chemin n'est pas absolu, essayer de le trouver dans le dossier du projet
-                if credentials_path and not os.path.isabs(credentials_path):
-                    # Essayer depuis le dossier BASE_DIR
-                    potential_path = os.path.join(settings.BASE_DIR, credentials_path)
-                    if os.path.exists(potential_path):
-                        credentials_path = potential_path
-                    # Essayer aussi avec juste le nom du fichier dans BASE_DIR
-                    elif os.path.exists(os.path.join(settings.BASE_DIR, os.path.basename(credentials_path))):
-                        credentials_path = os.path.join(settings.BASE_DIR, os.path.basename(credentials_path))
-                
-                # Si toujours pas trouvé, chercher le fichier JSON dans BASE_DIR
-                if not credentials_path or not os.path.exists(credentials_path):
-                    # Chercher les fichiers JSON dans BASE_DIR
-                    json_files = [f for f in os.listdir(settings.BASE_DIR) if f.endswith('.json') and 'aerial' in f.lower()]
-                    if json_files:
-                        credentials_path = os.path.join(settings.BASE_DIR, json_files[0])
-                
-                # Initialiser le client Translation avec les credentials explicites
-                if credentials_path and os.path.exists(credentials_path):
-                    # Charger les credentials depuis le fichier JSON
-                    credentials = service_account.Credentials.from_service_account_file(credentials_path)
-                    translate_client = translate.Client(credentials=credentials)
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.info(f'Translation API: Utilisation des credentials depuis {credentials_path}')
-                else:
-                    # Essayer avec les credentials par défaut
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f'Translation API: Credentials non trouvés. Cherché à: {credentials_path}')
-                    logger.warning('Translation API: Tentative avec les credentials par défaut (GOOGLE_APPLICATION_CREDENTIALS)')
-                    translate_client = translate.Client()
-                
-                # Traduire de l'arabe (ar) vers le français (fr)
-                result = translate_client.translate(
-                    original_text,
-                    source_language='ar',  # Code de langue source (arabe/Darija)
-                    target_language='fr'   # Code de langue cible (français)
-                )
-                
-                translated_text = result['translatedText']
-                
-                # Décoder les entités HTML (comme &#39; pour ')
-                import html
-                translated_text = html.unescape(translated_text)
-                
-                # Log pour le débogage
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.info(f'Traduction Darija → Français: "{original_text}" → "{translated_text}"')
-                
-            except ImportError:
-                translation_error = 'Google Cloud Translation API n\'est pas installé. Installez-le avec: pip install google-cloud-translate'
-            except Exception as e:
-                translation_error = f'Erreur lors de la traduction: {str(e)}'
-                # Log l'erreur pour le débogage
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'Erreur de traduction: {translation_error}')
-                # En cas d'erreur de traduction, on continue avec le texte original
-        
-        # Préparer la réponse
-        response_data = {
-            'text': original_text,  # Texte original transcrit
-            'confidence': best_transcription.get('confidence', 0),
-            'transcriptions': transcriptions,
-            'detected_language': final_detected_language,
-            'detected_language_name': language_names.get(final_detected_language, final_detected_language),
-            'supported_languages': ['ar-MA', 'fr-FR', 'en-US'],
-        }
-        
-        # Ajouter la traduction si disponible
-        if translated_text:
-            response_data['translated_text'] = translated_text
-            response_data['search_text'] = translated_text  # Texte à utiliser pour la recherche
-            response_data['translation_status'] = 'success'  # Indicateur de succès
-        else:
-            # Si pas de traduction, utiliser le texte original pour la recherche
-            response_data['search_text'] = original_text
-            response_data['translation_status'] = 'not_needed' if not is_darija else 'failed'
-            if translation_error:
-                response_data['translation_warning'] = translation_error
-                response_data['translation_status'] = 'error'
-                # Log l'erreur pour le débogage
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'Erreur de traduction: {translation_error}')
-        
-        # Toujours inclure search_text pour que le frontend sache quoi utiliser
-        # Log pour le débogage
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f'Langue détectée: {final_detected_language}, Normalisée: {normalized_language}, Est Darija: {is_darija}')
-        logger.info(f'Texte original: "{original_text}", Texte de recherche: "{response_data["search_text"]}"')
+        # Mode streaming (?stream=1) : transcription puis traduction en Server-Sent Events
+        if request.query_params.get('stream') in ('1', 'true', 'sse'):
+            response = StreamingHttpResponse(
+                transcription_event_stream(audio_file, content_type),
+                content_type='text/event-stream',
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'  # pas de mise en tampon par nginx
+            return response
+        
+        # Reconnaissance + traduction (un envoi identique est servi depuis le cache).
+        # Le fichier est lu sur place (mmap ou tampon mémoire), sans copie en bytes
+        try:
+            with uploaded_audio_buffer(audio_file) as audio_content:
+                response_data = transcribe(audio_content, content_type)
+        except SpeechConfigurationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
         return Response(response_data, status=status.HTTP_200_OK)
         
@@ -668,4 +372,262 @@ def transcribe_audio(request):
         return Response({
             'error': f'Erreur lors de la transcription: {str(e)}',
             'details': error_trace if settings.DEBUG else None
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def transcribe_audio_batch(request):
+    """
+    Transcription de plusieurs fichiers audio en une requête (champ multipart `audio` répété).
+    Les fichiers sont traités en parallèle ; chaque élément a son propre résultat ou sa propre erreur.
+    """
+    options = getattr(settings, 'SPEECH_BATCH', {})
+    max_items = options.get('MAX_ITEMS', 20)
+    max_total_bytes = options.get('MAX_TOTAL_BYTES', 50 * 1024 * 1024)
+    
+    audio_files = request.FILES.getlist('audio')
+    if not audio_files:
+        return Response({'error': 'Aucun fichier audio fourni.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(audio_files) > max_items:
+        return Response({'error': f'Trop de fichiers audio (max {max_items}).'}, status=status.HTTP_400_BAD_REQUEST)
+    if sum(audio_file.size for audio_file in audio_files) > max_total_bytes:
+        return Response({'error': f'Lot trop volumineux (max {max_total_bytes // (1024 * 1024)}MB).'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        from google.cloud import speech  # noqa: F401
+    except ImportError:
+        return Response({
+            'error': 'Google Cloud Speech-to-Text n\'est pas installé. Installez-le avec: pip install google-cloud-speech'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    # Les fichiers trop volumineux sont refusés individuellement, sans bloquer le lot
+    results = [None] * len(audio_files)
+    items = []
+    positions = []
+    with ExitStack() as buffers:
+        for index, audio_file in enumerate(audio_files):
+            if audio_file.size > 10 * 1024 * 1024:
+                results[index] = (None, 'Le fichier audio est trop volumineux (max 10MB).')
+                continue
+            audio_content = buffers.enter_context(uploaded_audio_buffer(audio_file))
+            items.append((audio_content, audio_file.content_type or 'audio/webm'))
+            positions.append(index)
+        
+        for index, outcome in zip(positions, transcribe_batch(items, options.get('PARALLELISM', 4))):
+            results[index] = outcome
+    
+    response_items = []
+    for index, (audio_file, (result, error)) in enumerate(zip(audio_files, results)):
+        item = {'index': index, 'filename': audio_file.name}
+        if error is None:
+            item['status'] = 'success'
+            item['result'] = result
+        else:
+            item['status'] = 'error'
+            item['error'] = error
+        response_items.append(item)
+    
+    failed = sum(1 for item in response_items if item['status'] == 'error')
+    return Response({
+        'results': response_items,
+        'succeeded': len(response_items) - failed,
+        'failed': failed,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def create_transcription_job(request):
+    """
+    Transcription d'un audio long en arrière-plan : retourne immédiatement l'identifiant
+    de la tâche, à interroger ensuite sur speech/jobs/<id>/
+    """
+    if 'audio' not in request.FILES:
+        return Response({'error': 'Aucun fichier audio fourni.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    audio_file = request.FILES['audio']
+    max_bytes = get_jobs_settings()['MAX_UPLOAD_BYTES']
+    if audio_file.size > max_bytes:
+        return Response({'error': f'Le fichier audio est trop volumineux (max {max_bytes // (1024 * 1024)}MB).'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        job = enqueue_transcription(audio_file, audio_file.content_type or 'audio/webm', user=request.user)
+    except UnsupportedLongAudio as e:
+        return Response({'error': str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    except JobQueueFull as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    return Response({
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': request.build_absolute_uri(f'/api/speech/jobs/{job.id}/'),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def get_transcription_job(request, job_id):
+    """État d'une tâche de transcription, avec le résultat quand elle est terminée"""
+    job = TranscriptionJob.objects.defer('audio_path').filter(pk=job_id).first()
+    # Une tâche créée par un utilisateur connecté n'est visible que par lui
+    if job is None or (job.user_id and job.user_id != request.user.pk):
+        return Response({'error': 'Tâche de transcription introuvable.'}, status=status.HTTP_404_NOT_FOUND)
+    
+    # Reprendre les tâches en attente si ce processus n'a pas encore de worker (après un redémarrage)
+    if job.status == TranscriptionJob.STATUS_PENDING and get_jobs_settings()['EMBEDDED_WORKER']:
+        get_transcription_worker().notify()
+    
+    response_data = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == TranscriptionJob.STATUS_SUCCEEDED:
+        response_data['result'] = job.result
+    elif job.status == TranscriptionJob.STATUS_FAILED:
+        response_data['error'] = job.error
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+def _get_audio_upload(request, upload_id):
+    """Upload de l'utilisateur (ou anonyme), None s'il n'existe pas ou a expiré"""
+    options = uploads.get_uploads_settings()
+    uploads.maybe_purge_stale_uploads(options)
+    upload = uploads.active_uploads(options).filter(pk=upload_id).first()
+    if upload is None or (upload.user_id and upload.user_id != request.user.pk):
+        return None
+    return upload
+
+
+def _upload_response(request, upload, status_code=status.HTTP_200_OK):
+    offset = uploads.current_offset(upload)
+    response = Response({
+        'upload_id': str(upload.id),
+        'offset': offset,
+        'size': upload.size_bytes,
+        'complete': offset == upload.size_bytes,
+        'expires_at': uploads.expires_at(upload),
+        'upload_url': request.build_absolute_uri(f'/api/speech/uploads/{upload.id}/'),
+    }, status=status_code)
+    response['Upload-Offset'] = str(offset)
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def create_audio_upload(request):
+    """Créer un upload reprenable : {"size": taille totale en octets, "content_type": type MIME}"""
+    try:
+        size_bytes = int(request.data.get('size'))
+    except (TypeError, ValueError):
+        return Response({'error': 'Taille totale (size) requise.'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    content_type = request.data.get('content_type') or 'audio/webm'
+    try:
+        # Refuser dès maintenant un audio qui ne pourra pas être transcrit une fois envoyé
+        ensure_long_audio_supported(size_bytes, content_type)
+    except UnsupportedLongAudio as e:
+        return Response({'error': str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    
+    try:
+        upload = uploads.create_upload(size_bytes, content_type, user=request.user)
+    except uploads.UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return _upload_response(request, upload, status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'HEAD', 'PATCH', 'DELETE'])
+@permission_classes([permissions.AllowAny])
+def audio_upload(request, upload_id):
+    """
+    GET (ou HEAD) : offset actuel. PATCH : ajouter un morceau (corps brut, en-tête Upload-Offset).
+    DELETE : abandonner l'upload.
+    """
+    upload = _get_audio_upload(request, upload_id)
+    if upload is None:
+        return Response({'error': 'Upload introuvable ou expiré.'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method == 'DELETE':
+        uploads.discard_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'error': 'En-tête Upload-Offset requis.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.META.get('CONTENT_LENGTH'):
+            return Response({'error': 'En-tête Content-Length requis.'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        
+        # Le corps est lu directement depuis le flux de la requête, sans passer par les parsers
+        try:
+            uploads.append_chunk(upload, offset, request.stream, int(request.META['CONTENT_LENGTH']))
+        except uploads.OffsetMismatch as e:
+            response = Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = str(e.offset)
+            return response
+        except uploads.UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return _upload_response(request, upload)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def finalize_audio_upload(request, upload_id):
+    """
+    Terminer un upload et lancer la transcription : directe jusqu'à 10MB,
+    sinon (ou avec ?mode=job) en tâche d'arrière-plan.
+    L'upload est conservé jusqu'à son expiration : en cas d'échec ou de réponse perdue,
+    le client peut finaliser à nouveau sans renvoyer l'audio.
+    """
+    upload = _get_audio_upload(request, upload_id)
+    if upload is None:
+        return Response({'error': 'Upload introuvable ou expiré.'}, status=status.HTTP_404_NOT_FOUND)
+    
+    use_job = upload.size_bytes > 10 * 1024 * 1024 or request.query_params.get('mode') == 'job'
+    if use_job:
+        try:
+            ensure_long_audio_supported(upload.size_bytes, upload.content_type)
+        except UnsupportedLongAudio as e:
+            return Response({'error': str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    
+    try:
+        path = uploads.completed_upload_path(upload)
+    except uploads.IncompleteUpload as e:
+        response = Response({'error': str(e), 'offset': uploads.current_offset(upload)},
+                            status=status.HTTP_409_CONFLICT)
+        response['Upload-Offset'] = str(uploads.current_offset(upload))
+        return response
+    
+    if use_job:
+        # Finalisation répétée : renvoyer la tâche déjà lancée plutôt qu'en créer une seconde
+        job = upload.job if upload.job_id else None
+        if job is None or job.status == TranscriptionJob.STATUS_FAILED:
+            try:
+                job = enqueue_transcription_file(path, upload.content_type, user=request.user, keep_source=True)
+            except JobQueueFull as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            upload.job = job
+            upload.save(update_fields=['job', 'updated_at'])
+        return Response({
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': request.build_absolute_uri(f'/api/speech/jobs/{job.id}/'),
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    # Une nouvelle finalisation après succès est servie par le cache des transcriptions
+    try:
+        with mapped_file(path) as audio_content:
+            response_data = transcribe(audio_content, upload.content_type)
+    except SpeechConfigurationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        return Response({'error': f'Erreur lors de la transcription: {str(e)}'},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(response_data, status=status.HTTP_200_OK)
@@ -13,5 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kach_bridge.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
 
+# Importé après l'initialisation de Django
+from api.streaming import speech_stream_application  # noqa: E402
+
+# Routes WebSocket (les requêtes HTTP sont servies par Django)
+websocket_routes = {
+    '/ws/speech/stream/': speech_stream_application,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        handler = websocket_routes.get(scope['path'])
+        if handler is None:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        return await handler(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -61,6 +61,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS doit être en haut
+    'api.middleware.RequestSizeLimitMiddleware',  # refuse les corps trop volumineux avant leur lecture
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -208,6 +209,134 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     # S'assurer que les tokens ont un jti (JWT ID) pour la blacklist
     'TOKEN_OBTAIN_SERIALIZER': 'rest_framework_simplejwt.serializers.TokenObtainPairSerializer',
+    # Refuser les refresh tokens émis avant le dernier logout (User.tokens_valid_after)
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.EpochTokenRefreshSerializer',
+}
+
+# Cache de révocation des tokens (voir api/revocation.py)
+# BACKEND 'local': LRU en mémoire par processus, les révocations faites par un autre
+# processus sont visibles après NEGATIVE_TTL / BLOOM_REFRESH_SECONDS secondes.
+# BACKEND 'shared': utilise le cache Django CACHE_ALIAS (Redis, Memcached...) partagé entre processus.
+TOKEN_REVOCATION_CACHE = {
+    'BACKEND': config('TOKEN_REVOCATION_BACKEND', default='local'),
+    'CACHE_ALIAS': config('TOKEN_REVOCATION_CACHE_ALIAS', default='default'),
+    'MAX_ENTRIES': config('TOKEN_REVOCATION_MAX_ENTRIES', default=10000, cast=int),
+    'NEGATIVE_TTL': config('TOKEN_REVOCATION_NEGATIVE_TTL', default=60, cast=int),
+    # Capacité minimale : le filtre est dimensionné sur le nombre de jti révoqués à chaque reconstruction
+    'BLOOM_CAPACITY': config('TOKEN_REVOCATION_BLOOM_CAPACITY', default=100000, cast=int),
+    'BLOOM_ERROR_RATE': config('TOKEN_REVOCATION_BLOOM_ERROR_RATE', default=0.001, cast=float),
+    'BLOOM_REFRESH_SECONDS': config('TOKEN_REVOCATION_BLOOM_REFRESH_SECONDS', default=60, cast=int),
+}
+
+# Utilisateur construit depuis les claims de l'access token, sans requête par requête
+# (voir api/authentication.py). Avec le BACKEND 'local', un logout ou une modification
+# du compte faits par un autre processus sont pris en compte après NEGATIVE_TTL secondes.
+JWT_LAZY_USER = config('JWT_LAZY_USER', default=False, cast=bool)
+
+# Introspection des tokens par lot pour les services internes (auth/introspect/)
+# Les appels doivent envoyer l'en-tête X-Internal-Token ; vide = endpoint fermé
+INTERNAL_SERVICE_TOKEN = config('INTERNAL_SERVICE_TOKEN', default='')
+INTERNAL_INTROSPECTION_MAX_TOKENS = config('INTERNAL_INTROSPECTION_MAX_TOKENS', default=100, cast=int)
+
+# Suivi des access tokens dans OutstandingToken (voir api/tokens.py)
+# 'stateless' (aucune ligne par access token), 'write_behind' (insertions par lots) ou 'sync'
+ACCESS_TOKEN_TRACKING = config('ACCESS_TOKEN_TRACKING', default='stateless')
+ACCESS_TOKEN_WRITE_BEHIND_BATCH_SIZE = config('ACCESS_TOKEN_WRITE_BEHIND_BATCH_SIZE', default=100, cast=int)
+ACCESS_TOKEN_WRITE_BEHIND_INTERVAL = config('ACCESS_TOKEN_WRITE_BEHIND_INTERVAL', default=2.0, cast=float)
+# Tokens conservés en mémoire pour un nouvel essai quand l'insertion échoue
+ACCESS_TOKEN_WRITE_BEHIND_MAX_PENDING = config('ACCESS_TOKEN_WRITE_BEHIND_MAX_PENDING', default=10000, cast=int)
+
+# Purge des tokens expirés (voir api/pruning.py et la commande prune_tokens)
+# TOKEN_PRUNING_INTERVAL > 0 active une purge périodique dans le processus (en secondes)
+TOKEN_PRUNING_INTERVAL = config('TOKEN_PRUNING_INTERVAL', default=0, cast=int)
+TOKEN_PRUNING_BATCH_SIZE = config('TOKEN_PRUNING_BATCH_SIZE', default=500, cast=int)
+TOKEN_PRUNING_THROTTLE = config('TOKEN_PRUNING_THROTTLE', default=0.1, cast=float)
+
+# Google Sign-In (voir api/google_auth.py)
+# ID client OAuth attendu dans le claim 'aud' des id_tokens (obligatoire pour la connexion par credential)
+GOOGLE_OAUTH_CLIENT_ID = config('GOOGLE_OAUTH_CLIENT_ID', default='')
+GOOGLE_ID_TOKEN_KEY_SOURCE = config('GOOGLE_ID_TOKEN_KEY_SOURCE', default='api.google_auth.GoogleCertsKeySource')
+# Cache disque des certificats Google (désactivé si vide) : chemin dans un répertoire
+# privé au service, par exemple BASE_DIR / 'var' / 'google_certs.json'
+GOOGLE_CERTS_CACHE_FILE = config('GOOGLE_CERTS_CACHE_FILE', default='')
+GOOGLE_USERINFO_CACHE_TTL = config('GOOGLE_USERINFO_CACHE_TTL', default=60, cast=int)
+
+# Client HTTP sortant partagé (voir api/http_client.py)
+OUTBOUND_HTTP = {
+    'POOL_CONNECTIONS': config('OUTBOUND_HTTP_POOL_CONNECTIONS', default=10, cast=int),
+    'POOL_MAXSIZE': config('OUTBOUND_HTTP_POOL_MAXSIZE', default=20, cast=int),
+    'CONNECT_TIMEOUT': config('OUTBOUND_HTTP_CONNECT_TIMEOUT', default=3.05, cast=float),
+    'READ_TIMEOUT': config('OUTBOUND_HTTP_READ_TIMEOUT', default=10, cast=float),
+    'RETRIES': config('OUTBOUND_HTTP_RETRIES', default=3, cast=int),
+    'BACKOFF_FACTOR': config('OUTBOUND_HTTP_BACKOFF_FACTOR', default=0.3, cast=float),
+    'BACKOFF_JITTER': config('OUTBOUND_HTTP_BACKOFF_JITTER', default=0.3, cast=float),
+}
+
+# Construire les clients Speech-to-Text et Translation au démarrage (voir api/google_clients.py)
+GOOGLE_CLIENTS_EAGER_INIT = config('GOOGLE_CLIENTS_EAGER_INIT', default=False, cast=bool)
+
+# Cache des traductions Darija -> Français (voir api/translation.py)
+TRANSLATION_CACHE = {
+    'MEMORY_MAX_ENTRIES': config('TRANSLATION_CACHE_MEMORY_MAX_ENTRIES', default=5000, cast=int),
+    'TTL': config('TRANSLATION_CACHE_TTL', default=30 * 24 * 3600, cast=int),
+    'MAX_ROWS': config('TRANSLATION_CACHE_MAX_ROWS', default=100000, cast=int),
+}
+
+# Cache des résultats de transcription, indexé par le contenu audio (voir api/speech.py)
+TRANSCRIPTION_CACHE = {
+    'MAX_ENTRIES': config('TRANSCRIPTION_CACHE_MAX_ENTRIES', default=500, cast=int),
+    'TTL': config('TRANSCRIPTION_CACHE_TTL', default=3600, cast=int),
+}
+
+# Transcription en streaming par WebSocket (voir api/streaming.py)
+SPEECH_STREAMING = {
+    'MAX_BUFFERED_BYTES': config('SPEECH_STREAMING_MAX_BUFFERED_BYTES', default=512 * 1024, cast=int),
+    'MAX_STREAM_BYTES': config('SPEECH_STREAMING_MAX_STREAM_BYTES', default=10 * 1024 * 1024, cast=int),
+    'MAX_DURATION': config('SPEECH_STREAMING_MAX_DURATION', default=290, cast=int),
+    'IDLE_TIMEOUT': config('SPEECH_STREAMING_IDLE_TIMEOUT', default=30, cast=int),
+}
+
+# Normalisation de l'audio avant Speech-to-Text (voir api/audio.py)
+AUDIO_NORMALIZATION = {
+    'ENABLED': config('AUDIO_NORMALIZATION_ENABLED', default=True, cast=bool),
+    'TARGET_SAMPLE_RATE': config('AUDIO_NORMALIZATION_SAMPLE_RATE', default=16000, cast=int),
+}
+
+# Détection d'activité vocale et reconnaissance des segments en parallèle (voir api/vad.py)
+VOICE_ACTIVITY = {
+    'ENABLED': config('VOICE_ACTIVITY_ENABLED', default=True, cast=bool),
+    'MARGIN_DB': config('VOICE_ACTIVITY_MARGIN_DB', default=10.0, cast=float),
+    'MIN_SILENCE_MS': config('VOICE_ACTIVITY_MIN_SILENCE_MS', default=600, cast=int),
+    'MAX_WORKERS': config('VOICE_ACTIVITY_MAX_WORKERS', default=4, cast=int),
+}
+
+# Transcription par lot (api/speech/transcribe/batch/)
+SPEECH_BATCH = {
+    'MAX_ITEMS': config('SPEECH_BATCH_MAX_ITEMS', default=20, cast=int),
+    'MAX_TOTAL_BYTES': config('SPEECH_BATCH_MAX_TOTAL_BYTES', default=50 * 1024 * 1024, cast=int),
+    'PARALLELISM': config('SPEECH_BATCH_PARALLELISM', default=4, cast=int),
+}
+
+# Transcriptions longues en arrière-plan (voir api/jobs.py)
+SPEECH_JOBS = {
+    'STORAGE_DIR': config('SPEECH_JOBS_STORAGE_DIR', default=''),
+    'MAX_UPLOAD_BYTES': config('SPEECH_JOBS_MAX_UPLOAD_BYTES', default=100 * 1024 * 1024, cast=int),
+    'CONCURRENCY': config('SPEECH_JOBS_CONCURRENCY', default=2, cast=int),
+    'MAX_PENDING': config('SPEECH_JOBS_MAX_PENDING', default=100, cast=int),
+    'RETENTION': config('SPEECH_JOBS_RETENTION', default=7 * 24 * 3600, cast=int),
+    'EMBEDDED_WORKER': config('SPEECH_JOBS_EMBEDDED_WORKER', default=True, cast=bool),
+}
+
+# Fichiers envoyés : gardés en mémoire jusqu'à cette taille, puis écrits dans un
+# fichier temporaire (lu ensuite par mmap, sans copie, voir api/audio.py)
+FILE_UPLOAD_MAX_MEMORY_SIZE = config('FILE_UPLOAD_MAX_MEMORY_SIZE', default=2621440, cast=int)
+
+# Uploads audio reprenables (voir api/uploads.py)
+SPEECH_UPLOADS = {
+    'STORAGE_DIR': config('SPEECH_UPLOADS_STORAGE_DIR', default=''),
+    'MAX_UPLOAD_BYTES': config('SPEECH_UPLOADS_MAX_UPLOAD_BYTES', default=100 * 1024 * 1024, cast=int),
+    'MAX_CHUNK_BYTES': config('SPEECH_UPLOADS_MAX_CHUNK_BYTES', default=8 * 1024 * 1024, cast=int),
+    'TTL': config('SPEECH_UPLOADS_TTL', default=24 * 3600, cast=int),
 }
 
 # CORS Settings - Configuration pour permettre les requêtes depuis mobile et web
@@ -241,5 +370,16 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'upload-offset',
+    'if-match',
+    'if-none-match',
+    'if-modified-since',
+]
+
+# En-têtes lisibles par le client (offset des uploads reprenables, validateurs du profil)
+CORS_EXPOSE_HEADERS = [
+    'upload-offset',
+    'etag',
+    'last-modified',
 ]
 